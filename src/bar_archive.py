@@ -0,0 +1,72 @@
+"""已结束月份K线的列式归档
+
+每个序列一个目录，每列一个原始小端数组文件（列类型同内存缓冲区），按时间顺序追加，
+读取时用 np.memmap 映射后二分定位并切片，不复制数据，耗时与读取的区间成正比。
+各月份在文件中的行范围记录在数据库的归档清单中（以清单为准，文件末尾超出清单的数据视为未完成的写入）。
+写入新月份时追加到末尾；需要插入更早的数据时整体重写为新版本目录，旧版本由调用方在确认无读取后删除
+"""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from bar_buffer import BAR_DTYPES
+
+
+class BarArchive:
+    """K线归档文件：root/<series_id>/v<version>/<列名>.bin"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def series_path(self, series_id, version):
+        return os.path.join(self.root, str(series_id), f"v{version}")
+
+    def read(self, series_id, version, row_start, row_end, from_time, to_time):
+        """读取第 [row_start, row_end) 行中 [from_time, to_time] 内的K线（DataFrame，列为文件的只读映射）"""
+        path = self.series_path(series_id, version)
+        count = row_end - row_start
+        if count <= 0:
+            return pd.DataFrame({name: np.empty(0, dtype) for name, dtype in BAR_DTYPES})
+
+        columns = {}
+        for name, dtype in BAR_DTYPES:
+            dtype = np.dtype(dtype).newbyteorder('<')
+            columns[name] = np.memmap(os.path.join(path, f"{name}.bin"), dtype=dtype, mode='r',
+                                      offset=row_start * dtype.itemsize, shape=(count,))
+        timestamps = columns['timestamp']
+        lo = np.searchsorted(timestamps, from_time, side='left')
+        hi = np.searchsorted(timestamps, to_time, side='right')
+        return pd.DataFrame({name: array[lo:hi] for name, array in columns.items()}, copy=False)
+
+    def append(self, series_id, version, rows, bars):
+        """在已有的 rows 行之后追加K线（须晚于已归档的数据），写入并同步到磁盘，返回新的总行数"""
+        path = self.series_path(series_id, version)
+        os.makedirs(path, exist_ok=True)
+        for name, dtype in BAR_DTYPES:
+            dtype = np.dtype(dtype).newbyteorder('<')
+            with open(os.path.join(path, f"{name}.bin"), 'a+b') as f:
+                # 丢弃上次未记入清单的写入
+                f.truncate(rows * dtype.itemsize)
+                f.write(np.ascontiguousarray(bars[name], dtype=dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        return rows + len(bars)
+
+    def rewrite(self, series_id, version, bars):
+        """将完整的K线写为新版本目录（已存在时覆盖），返回行数"""
+        shutil.rmtree(self.series_path(series_id, version), ignore_errors=True)
+        return self.append(series_id, version, 0, bars)
+
+    def remove_versions(self, series_id, keep=None):
+        """删除序列除 keep 以外的版本目录（keep=None 时删除整个序列）"""
+        series_path = os.path.join(self.root, str(series_id))
+        if not os.path.isdir(series_path):
+            return
+        if keep is None:
+            shutil.rmtree(series_path, ignore_errors=True)
+            return
+        for entry in os.listdir(series_path):
+            if entry != f"v{keep}":
+                shutil.rmtree(os.path.join(series_path, entry), ignore_errors=True)
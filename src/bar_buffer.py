@@ -0,0 +1,167 @@
+"""热点序列的内存K线缓存
+
+每个 (symbol, resolution) 一个定长的列式缓冲区（numpy 连续数组，每根K线48字节），
+只在尾部追加，超出容量时丢弃最早的K线；区间查询用二分定位后直接切片。
+缓冲区之间按最近使用淘汰，总内存不超过预算
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+BAR_DTYPES = (
+    ('timestamp', 'int64'),
+    ('open', 'float64'),
+    ('high', 'float64'),
+    ('low', 'float64'),
+    ('close', 'float64'),
+    ('volume', 'int64'),
+)
+BYTES_PER_BAR = sum(np.dtype(dtype).itemsize for _, dtype in BAR_DTYPES)
+
+
+class BarBuffer:
+    """单个序列的尾部K线，covered_from/covered_to 为缓冲区完整覆盖的时间区间"""
+
+    def __init__(self, capacity, bars, covered_from, covered_to):
+        self.capacity = capacity
+        self.covered_from = covered_from
+        self.covered_to = covered_to
+        self._columns = {name: np.empty(0, dtype) for name, dtype in BAR_DTYPES}
+        self._start = self._end = 0
+        self.append(bars, covered_to)
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self._columns.values())
+
+    @property
+    def last_time(self):
+        return int(self._columns['timestamp'][self._end - 1]) if len(self) else None
+
+    def append(self, bars, covered_to):
+        """追加不早于最后一根的K线（时间相同则覆盖最后一根），超出容量时丢弃最早的K线"""
+        columns = {name: np.asarray(bars[name], dtype=dtype) for name, dtype in BAR_DTYPES}
+        timestamps = columns['timestamp']
+        last_time = self.last_time
+        if last_time is not None:
+            keep = timestamps >= last_time
+            if not keep.all():
+                columns = {name: array[keep] for name, array in columns.items()}
+                timestamps = columns['timestamp']
+            if len(timestamps) and timestamps[0] == last_time:
+                self._end -= 1
+
+        count = min(len(timestamps), self.capacity)
+        if count:
+            columns = {name: array[len(array) - count:] for name, array in columns.items()}
+            overflow = len(self) + count - self.capacity
+            if overflow > 0:
+                self._start += overflow
+            self._reserve(count)
+            for name, array in columns.items():
+                self._columns[name][self._end:self._end + count] = array
+            self._end += count
+            if overflow > 0 or len(timestamps) > count:
+                self.covered_from = int(self._columns['timestamp'][self._start])
+
+        self.covered_to = max(self.covered_to, covered_to)
+
+    def _reserve(self, count):
+        """保证尾部还能写入 count 根：空间不足时整理到新数组开头（预留至多1/4容量的余量）"""
+        if self._end + count <= len(self._columns['timestamp']):
+            return
+        size = len(self) + count
+        physical = max(size, min(2 * size, self.capacity + self.capacity // 4))
+        for name, dtype in BAR_DTYPES:
+            array = np.empty(physical, dtype)
+            array[:len(self)] = self._columns[name][self._start:self._end]
+            self._columns[name] = array
+        self._start, self._end = 0, len(self)
+
+    def slice(self, from_time, to_time):
+        """返回 [from_time, to_time] 内的K线（DataFrame，列为 BAR_DTYPES）"""
+        timestamps = self._columns['timestamp'][self._start:self._end]
+        lo = self._start + np.searchsorted(timestamps, from_time, side='left')
+        hi = self._start + np.searchsorted(timestamps, to_time, side='right')
+        # 复制切片：覆盖最后一根时会原地修改数组
+        return pd.DataFrame({name: self._columns[name][lo:hi].copy() for name, _ in BAR_DTYPES})
+
+
+class BarCache:
+    """按 (symbol, resolution) 保存 BarBuffer，最近最少使用的先淘汰，可在多线程间共享"""
+
+    def __init__(self, memory_budget, capacity):
+        self.memory_budget = memory_budget
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._buffers = OrderedDict()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def coverage(self, key):
+        """返回缓冲区覆盖的 (covered_from, covered_to, last_time)，不存在时返回None"""
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                return None
+            self._buffers.move_to_end(key)
+            return buffer.covered_from, buffer.covered_to, buffer.last_time
+
+    def slice(self, key, from_time, to_time):
+        with self._lock:
+            buffer = self._buffers.get(key)
+            return buffer.slice(from_time, to_time) if buffer is not None else None
+
+    def read(self, key, from_time, to_time):
+        """缓冲区覆盖 from_time 时在同一次加锁内返回 (covered_to, [from_time, to_time] 的K线)，否则返回None"""
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None or buffer.covered_from > from_time:
+                return None
+            self._buffers.move_to_end(key)
+            return buffer.covered_to, buffer.slice(from_time, to_time)
+
+    def store(self, key, bars, covered_from, covered_to):
+        """用一段完整覆盖 [covered_from, covered_to] 的K线新建（或替换）缓冲区"""
+        buffer = BarBuffer(self.capacity, bars, covered_from, covered_to)
+        with self._lock:
+            self._remove(key)
+            self._buffers[key] = buffer
+            self.nbytes += buffer.nbytes
+            self._evict()
+
+    def extend(self, key, bars, since, covered_to):
+        """追加 [since, covered_to] 内的新K线；与缓冲区不连续时丢弃该缓冲区"""
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                return
+            if buffer.covered_to < since:
+                self._remove(key)
+                return
+            self.nbytes -= buffer.nbytes
+            buffer.append(bars, covered_to)
+            self.nbytes += buffer.nbytes
+            self._evict()
+
+    def discard(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        buffer = self._buffers.pop(key, None)
+        if buffer is not None:
+            self.nbytes -= buffer.nbytes
+
+    def _evict(self):
+        # 至少保留刚使用的一个缓冲区
+        while self.nbytes > self.memory_budget and len(self._buffers) > 1:
+            _, buffer = self._buffers.popitem(last=False)
+            self.nbytes -= buffer.nbytes
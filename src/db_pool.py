@@ -0,0 +1,70 @@
+"""SQLite 连接池
+
+连接用完后归还复用（保留各连接的预编译语句缓存），每个连接打开时设置 WAL 及读性能相关的 PRAGMA。
+WAL 模式下读写互不阻塞，后台写入时请求线程照常读取
+"""
+import sqlite3
+import threading
+
+# 每个连接打开时执行的 PRAGMA
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),  # WAL 下只在检查点时同步，掉电最多丢失最近的事务，不会损坏数据库
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -16384),  # 每个连接16MB页缓存（负数单位为KB）
+    ('temp_store', 'MEMORY'),
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    """close() 时回滚未提交的事务并归还连接池，而不是真正关闭"""
+
+    pool = None
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+        self.pool.release(self)
+
+
+class ConnectionPool:
+    """SQLite 连接池：每个线程取用时独占一个连接，归还后供其他线程复用，最多保留 max_idle 个空闲连接"""
+
+    def __init__(self, path, max_idle=16, timeout=10, cached_statements=256, pragmas=PRAGMAS):
+        self.path = path
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.pragmas = pragmas
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+
+        # 连接在线程间传递但同一时刻只有一个使用者
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements, factory=PooledConnection)
+        conn.pool = self
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def release(self, conn):
+        with self._lock:
+            if any(idle is conn for idle in self._idle):  # 重复归还
+                return
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        sqlite3.Connection.close(conn)
+
+    def close_all(self):
+        """关闭全部空闲连接（如进程退出或数据库文件被替换前）"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            sqlite3.Connection.close(conn)
@@ -0,0 +1,131 @@
+"""SQLite 单写线程（write-behind）
+
+所有写操作排入有界队列，由一个专用线程按条数或等待时间分批在同一事务中执行，
+写锁只由该线程持有，其他线程不会在 SQLite 写锁上等待。每个操作在各自的
+SAVEPOINT 中执行，单个操作失败只回滚该操作
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class WriteBehindQueue:
+    """写操作队列：submit(fn) 排入 fn(conn)，返回在该操作提交后完成的 Future
+
+    一批累计 batch_rows 行（按各操作的 weight 计）或首个操作等待超过 max_latency 秒时提交；
+    队列最多 max_pending 个操作，满时 submit 阻塞（背压）。exclusive 操作（如 VACUUM）在事务之外单独执行
+    """
+
+    def __init__(self, connect, max_pending=1000, batch_rows=50000, max_latency=0.05, logger=None):
+        self.connect = connect
+        self.batch_rows = batch_rows
+        self.max_latency = max_latency
+        self.logger = logger or logging.getLogger(__name__)
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def backlog(self):
+        """队列中尚未执行的操作数"""
+        return self._queue.qsize()
+
+    def submit(self, fn, weight=1, timeout=None, exclusive=False):
+        """排入写操作 fn(conn)（不要在 fn 中提交），返回 Future
+
+        队列已满时最多等待 timeout 秒（None 为一直等待），仍满则抛出 queue.Full；
+        exclusive=True 时先提交此前的操作，再在事务之外单独执行 fn
+        """
+        self._start()
+        future = Future()
+        self._queue.put((fn, weight, future, 'exclusive' if exclusive else 'write'), timeout=timeout)
+        return future
+
+    def flush(self, timeout=None):
+        """等待此前排入的全部写操作提交"""
+        self._start()
+        future = Future()
+        self._queue.put((None, 0, future, 'flush'), timeout=timeout)
+        future.result(timeout)
+
+    def throttle(self, low_watermark, poll_interval=0.05):
+        """背压：等待队列积压降到 low_watermark 以下，供后台批量写入方在提交前调用"""
+        while self.backlog > low_watermark:
+            time.sleep(poll_interval)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+                # 进程退出前写完积压的操作
+                atexit.register(self.flush, 10)
+
+    def _run(self):
+        conn = self.connect()
+        while True:
+            batch = [self._queue.get()]
+            rows = batch[0][1]
+            deadline = time.monotonic() + self.max_latency
+            while rows < self.batch_rows and batch[-1][3] == 'write':
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+                rows += batch[-1][1]
+
+            if batch[-1][3] == 'exclusive':
+                self._apply(conn, batch[:-1])
+                self._run_exclusive(conn, batch[-1])
+            else:
+                self._apply(conn, batch)
+
+    def _run_exclusive(self, conn, op):
+        fn, _, future, _ = op
+        start = time.perf_counter()
+        try:
+            future.set_result(fn(conn))
+        except Exception as e:
+            self.logger.error(f"独占写操作失败: {e}", exc_info=True)
+            future.set_exception(e)
+        self.logger.info(f"独占写操作完成，耗时{time.perf_counter() - start:.1f}秒")
+
+    def _apply(self, conn, batch):
+        if not batch:
+            return
+        start = time.perf_counter()
+        results = []
+        try:
+            conn.execute("BEGIN")
+            for fn, _, _, _ in batch:
+                if fn is None:
+                    results.append((None, None))
+                    continue
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((fn(conn), None))
+                    conn.execute("RELEASE op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    self.logger.warning(f"写操作失败: {e}")
+                    results.append((None, e))
+            conn.commit()
+        except Exception as e:
+            # 提交失败：整批回滚，全部操作以该异常结束
+            self.logger.error(f"批量写入失败: {e}", exc_info=True)
+            if conn.in_transaction:
+                conn.rollback()
+            results = [(None, e)] * len(batch)
+
+        for (_, _, future, _), (result, error) in zip(batch, results):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        self.logger.debug(f"批量写入: {len(batch)}个操作，{time.perf_counter() - start:.3f}秒")
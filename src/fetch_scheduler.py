@@ -0,0 +1,112 @@
+"""上游数据源的并发抓取调度
+
+互不依赖的数据源在线程池中并行抓取，整体耗时取决于最慢的数据源而不是各数据源之和；
+每个数据源一个令牌桶限速，失败时按指数退避（带随机抖动）重试
+"""
+import random
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积累 capacity 个"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，令牌不足时等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class FetchScheduler:
+    """按数据源限速、带退避重试的并发抓取器，可在多线程间共享
+
+    rate_limits 为 {数据源: (每秒请求数, 突发上限)}，未列出的数据源使用 default_limit
+    """
+
+    def __init__(self, max_workers, rate_limits, default_limit=(1, 1),
+                 max_attempts=3, backoff_base=2, backoff_max=30):
+        self.max_workers = max_workers
+        self.default_limit = default_limit
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._buckets = {source: TokenBucket(*limit) for source, limit in rate_limits.items()}
+
+    def bucket(self, source):
+        with self._lock:
+            if source not in self._buckets:
+                self._buckets[source] = TokenBucket(*self.default_limit)
+            return self._buckets[source]
+
+    def backoff(self, attempt):
+        """第 attempt 次失败后的等待时间：指数增长，取上限后在 [一半, 全部] 之间随机"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    def call(self, source, fn, logger=None):
+        """限速并带重试地调用 fn()，重试耗尽后抛出最后一次异常"""
+        logger = logger or logging.getLogger(__name__)
+        for attempt in range(self.max_attempts):
+            self.bucket(source).acquire()
+            try:
+                return fn()
+            except Exception as e:
+                if attempt == self.max_attempts - 1:
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning(f"数据源 {source} 调用失败（第{attempt + 1}/{self.max_attempts}次），"
+                               f"{delay:.1f}秒后重试: {e}")
+                time.sleep(delay)
+
+    def call_first(self, alternatives, logger=None):
+        """依次尝试 [(数据源, fn), ...]，返回第一个成功的结果，全部失败时抛出最后一次异常"""
+        logger = logger or logging.getLogger(__name__)
+        error = None
+        for source, fn in alternatives:
+            try:
+                return self.call(source, fn, logger)
+            except Exception as e:
+                logger.warning(f"数据源 {source} 不可用: {e}")
+                error = e
+        raise error
+
+    def run(self, tasks, timeout=None, logger=None):
+        """并发执行 {名称: [(数据源, fn), ...]}，返回 {名称: 结果或异常}
+
+        timeout 秒内未完成的任务记为 TimeoutError（线程在后台自行结束，结果丢弃）
+        """
+        pool = ThreadPoolExecutor(max(1, min(self.max_workers, len(tasks))))
+        try:
+            futures = {name: pool.submit(self.call_first, alternatives, logger)
+                       for name, alternatives in tasks.items()}
+            wait(futures.values(), timeout=timeout)
+
+            results = {}
+            for name, future in futures.items():
+                if not future.done():
+                    results[name] = TimeoutError(f"{name} 超过{timeout}秒未完成")
+                elif future.exception() is not None:
+                    results[name] = future.exception()
+                else:
+                    results[name] = future.result()
+            return results
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
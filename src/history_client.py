@@ -0,0 +1,74 @@
+"""/udf/history 的Python客户端
+
+按二进制列式格式请求K线并直接读为 numpy 数组，供回测、notebook 等内部使用方调用。
+服务端返回JSON（无数据或旧版本服务端）时同样转换为数组
+"""
+import json
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+from history_codec import BINARY_MIMETYPE, HISTORY_FIELDS, decode_history_binary, read_bulk_frames
+
+
+def empty_history():
+    return {field: np.empty(0, dtype='int64' if field in ('t', 'v') else 'float64')
+            for field, _ in HISTORY_FIELDS}
+
+
+def parse_history_response(data, content_type):
+    """解析 /history 响应体，返回 {t,o,h,l,c,v: 数组}，无数据时为空数组"""
+    if content_type == BINARY_MIMETYPE:
+        return decode_history_binary(data)
+
+    payload = json.loads(data)
+    if payload.get('s') == 'no_data':
+        return empty_history()
+    if payload.get('s') != 'ok':
+        raise RuntimeError(f"获取K线失败: {payload.get('errmsg', payload)}")
+    return {field: np.asarray(payload[field]) for field, _ in HISTORY_FIELDS}
+
+
+def fetch_history(base_url, symbol, resolution, from_time, to_time, countback=None,
+                  price_type='float64', timeout=30):
+    """请求 symbol 的K线，base_url 为数据源地址（如 http://127.0.0.1:8080/udf）"""
+    params = {'symbol': symbol, 'resolution': resolution, 'from': from_time, 'to': to_time,
+              'price': price_type}
+    if countback:
+        params['countback'] = countback
+    url = f"{base_url.rstrip('/')}/history?{urllib.parse.urlencode(params)}"
+    request = urllib.request.Request(url, headers={'Accept': BINARY_MIMETYPE})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return parse_history_response(response.read(), response.headers.get_content_type())
+
+
+def fetch_history_bulk(base_url, symbols, resolution, from_time, to_time, countback=None,
+                       price_type='float64', binary=True, timeout=300):
+    """批量请求多个符号的K线，按服务端返回顺序逐个生成 (symbol, status, columns)
+
+    status 为 ok/no_data/error，非 ok 时 columns 为空数组；响应边读边解析，内存占用与符号数量无关
+    """
+    body = {'symbols': list(symbols), 'resolution': resolution, 'from': from_time, 'to': to_time,
+            'price': price_type}
+    if countback:
+        body['countback'] = countback
+    request = urllib.request.Request(
+        f"{base_url.rstrip('/')}/history_bulk", data=json.dumps(body).encode('utf-8'),
+        headers={'Content-Type': 'application/json',
+                 'Accept': BINARY_MIMETYPE if binary else 'application/x-ndjson'})
+
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        if response.headers.get_content_type() == BINARY_MIMETYPE:
+            yield from read_bulk_frames(response)
+            return
+
+        for line in response:
+            if not line.strip():
+                continue
+            payload = json.loads(line)
+            if payload['s'] == 'ok':
+                columns = {field: np.asarray(payload[field]) for field, _ in HISTORY_FIELDS}
+            else:
+                columns = empty_history()
+            yield payload['symbol'], payload['s'], columns
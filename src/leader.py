@@ -0,0 +1,61 @@
+"""多进程部署时的后台任务选主
+
+各工作进程竞争同一个锁文件上的非阻塞排他锁，持有者负责运行后台任务。锁在持有者退出（包括崩溃）时
+由操作系统释放，其余进程定期重试，由其中一个接替。须在 fork 之后的工作进程中竞选：fork 出的子进程
+会继承父进程已持有的 flock 锁
+"""
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LeaderElection:
+    """基于文件锁的选主：run(on_elected) 在后台线程中重试，当选后调用一次 on_elected()"""
+
+    def __init__(self, path, retry_interval=5, logger=None):
+        self.path = path
+        self.retry_interval = retry_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self._fd = None
+
+    @property
+    def is_leader(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        """尝试获取锁（已持有时直接返回True），返回是否当选"""
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+
+        # 文件描述符在进程生命周期内一直保持打开
+        self._fd = fd
+        return True
+
+    def run(self, on_elected):
+        """启动竞选线程，当选后在该线程中调用 on_elected()"""
+
+        def campaign():
+            while not self.try_acquire():
+                time.sleep(self.retry_interval)
+            self.logger.info(f"进程{os.getpid()}当选为后台任务进程")
+            on_elected()
+
+        thread = threading.Thread(target=campaign, name='leader-election', daemon=True)
+        thread.start()
+        return thread
@@ -9,7 +9,7 @@ from pathlib import Path
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory, render_template_string, jsonify
-from udf import udf_bp, start_update_thread, init_db
+from udf import udf_bp, start_background_tasks, init_db, DATA_DIR
 
 from flask import Flask
 
@@ -36,7 +36,7 @@ CHARTING_LIBRARY_STATIC_ASSETS_PATH = os.path.join(CHARTING_LIBRARY_BASE_PATH, "
 DATAFEEDS_BASE_PATH = os.path.join(STATIC_PATH, "datafeeds")
 
 # 确保数据目录存在
-Path(os.path.join(PROJECT_ROOT, "src", "data")).mkdir(parents=True, exist_ok=True)
+Path(os.path.join(DATA_DIR, "data")).mkdir(parents=True, exist_ok=True)
 
 # ---注册蓝图（添加url_prefix="/udf"）---
 app.register_blueprint(udf_bp, url_prefix="/udf")
@@ -123,8 +123,11 @@ if __name__ == "__main__":
     with app.app_context():
         init_db()
 
-    # 启动符号列表更新线程
-    start_update_thread(app)
+    # 启动后台任务（符号列表与行情更新只在竞选成功的进程中运行；生产环境多进程部署见 serve.py）。
+    # 调试模式下由重载器拉起的子进程处理请求，重载器所在的父进程不参与竞选
+    debug = True
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks(app)
 
-    # 运行应用
-    app.run(host="0.0.0.0", port=8080, debug=True)
+    # 运行应用（开发服务器）
+    app.run(host="0.0.0.0", port=8080, debug=debug)
@@ -0,0 +1,143 @@
+# !/usr/bin/env python
+# -*-coding:utf-8-*-
+"""生产环境入口：多进程 WSGI 服务
+
+    python serve.py --workers 8 --port 8080
+
+主进程初始化数据库并监听端口，然后 fork 出 N 个工作进程（默认为 CPU 核数）共享同一个监听套接字，
+由内核在进程间分发连接，每个工作进程用多线程 WSGI 服务器处理请求。符号列表、行情快照的更新与预热等
+后台任务只在竞选成功的一个工作进程中运行，结果经数据库共享给其他进程，上游请求量与进程数无关。
+工作进程退出后由主进程重新拉起；收到 SIGTERM/SIGINT 时通知全部工作进程写完积压数据后退出。
+不支持 fork 的平台（Windows）上退化为单进程多线程服务
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+from werkzeug.serving import make_server
+
+from main import app
+from udf import init_db, start_background_tasks, flush_access_stats, DB_POOL, DB_WRITER
+
+LISTEN_BACKLOG = 1024
+WORKER_STOP_TIMEOUT = 15  # 等待工作进程退出的最长时间（秒），超时后强制结束
+WORKER_RESTART_DELAY = 1  # 工作进程启动后很快退出时，重新拉起前的等待时间（秒），避免反复崩溃占满CPU
+
+logger = logging.getLogger('serve')
+
+
+def run_worker(sock, host, port):
+    """工作进程：启动后台任务后在共享的监听套接字上处理请求，退出前将访问统计与积压的写操作落库"""
+
+    def stop(signum, frame):
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        start_background_tasks(app)
+        server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+        logger.info(f"工作进程{os.getpid()}已启动")
+        server.serve_forever()
+    finally:
+        with app.app_context():
+            flush_access_stats()
+        DB_WRITER.flush(WORKER_STOP_TIMEOUT)
+
+
+def spawn_worker(sock, host, port):
+    """fork 一个工作进程，返回其进程号（子进程不会从本函数返回）"""
+    pid = os.fork()
+    if pid:
+        return pid
+
+    code = 0
+    try:
+        run_worker(sock, host, port)
+    except SystemExit as e:
+        code = e.code or 0
+    except BaseException:
+        logger.exception(f"工作进程{os.getpid()}异常退出")
+        code = 1
+    # 不回到主进程的调用栈
+    os._exit(code)
+
+
+def stop_workers(workers):
+    """通知全部工作进程退出，超时未退出的强制结束"""
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    deadline = time.monotonic() + WORKER_STOP_TIMEOUT
+    while workers and time.monotonic() < deadline:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            workers.pop(pid, None)
+        else:
+            time.sleep(0.1)
+    for pid in workers:
+        logger.warning(f"工作进程{pid}未及时退出，强制结束")
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+def serve(host, port, workers):
+    with app.app_context():
+        init_db()
+
+    if not hasattr(os, 'fork'):
+        logger.warning("当前平台不支持 fork，以单进程方式运行")
+        start_background_tasks(app)
+        make_server(host, port, app, threaded=True).serve_forever()
+        return
+
+    # 子进程不能继承主进程的数据库连接
+    DB_POOL.close_all()
+    sock = socket.create_server((host, port), backlog=LISTEN_BACKLOG)
+    sock.set_inheritable(True)
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    children = {}  # 进程号 -> 启动时刻
+    try:
+        for _ in range(workers):
+            children[spawn_worker(sock, host, port)] = time.monotonic()
+        logger.info(f"已启动{workers}个工作进程，监听 {host}:{port}")
+
+        while True:
+            pid, status = os.wait()
+            started = children.pop(pid, None)
+            if started is None:
+                continue
+            logger.warning(f"工作进程{pid}已退出（状态{status}），重新拉起")
+            if time.monotonic() - started < WORKER_RESTART_DELAY:
+                time.sleep(WORKER_RESTART_DELAY)
+            children[spawn_worker(sock, host, port)] = time.monotonic()
+    finally:
+        # 停止期间不再响应重复的信号
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        stop_workers(children)
+        sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多进程 WSGI 服务")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s in %(name)s: %(message)s')
+    serve(args.host, args.port, args.workers)
@@ -0,0 +1,100 @@
+"""跨进程共享的状态
+
+多个工作进程共用同一个数据库：值（JSON）与版本号存在 shared_state 表中，由写入方经单写线程发布，
+其他进程按版本号判断是否变化，只在变化时重新读取并解码，平时只有节流后的版本号查询；
+同一名称同时只有一个线程查询与解码，其他线程沿用上一次的值
+"""
+import json
+import threading
+import time
+
+
+class SharedState:
+    """shared_state 表中命名状态的进程内视图，可在多线程间共享
+
+    connect() 返回数据库连接（close() 时归还），submit(fn, timeout=) 将写操作 fn(conn) 排入单写线程并返回 Future
+    （队列已满且超过 timeout 秒时抛出 queue.Full）；
+    每个名称每 check_interval 秒最多查询一次版本号
+    """
+
+    def __init__(self, connect, submit, check_interval=1.0):
+        self.connect = connect
+        self.submit = submit
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries = {}  # name -> (版本号, 值, 下次检查时间)
+        self._refreshing = {}  # name -> 刷新锁
+
+    def version(self, name):
+        """返回名称的最新版本号（未发布过为0），最多滞后 check_interval 秒"""
+        return self._refresh(name)[0]
+
+    def get(self, name, default=None):
+        """返回名称的最新值，最多滞后 check_interval 秒"""
+        version, value = self._refresh(name)
+        return default if version == 0 else value
+
+    def publish(self, name, value=None, timeout=None):
+        """发布新值并递增版本号（value 为None时只递增版本号，用作变更通知），返回写入的 Future
+
+        本进程在写入完成后看到新值，不需要重新读取。timeout 为排队等待的上限，超时抛出 queue.Full
+        """
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+        def write(conn):
+            conn.execute('''
+            INSERT INTO shared_state (name, version, data, update_time) VALUES (?, 1, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET version = version + 1, data = excluded.data,
+                update_time = excluded.update_time
+            ''', (name, data, int(time.time())))
+            version = conn.execute("SELECT version FROM shared_state WHERE name = ?", (name,)).fetchone()[0]
+            with self._lock:
+                self._entries[name] = (version, value, time.monotonic() + self.check_interval)
+            return version
+
+        return self.submit(write, timeout=timeout)
+
+    def _refresh(self, name):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(name)
+            lock = self._refreshing.setdefault(name, threading.Lock())
+        if entry is not None and now < entry[2]:
+            return entry[:2]
+
+        # 已有其他线程在刷新时直接沿用上一次的值，尚无值时等待其完成
+        if not lock.acquire(blocking=entry is None):
+            return entry[:2]
+        try:
+            with self._lock:
+                entry = self._entries.get(name)
+            if entry is not None and time.monotonic() < entry[2]:
+                return entry[:2]
+            return self._load(name, entry, time.monotonic())
+        finally:
+            lock.release()
+
+    def _load(self, name, entry, now):
+        conn = self.connect()
+        try:
+            row = conn.execute("SELECT version FROM shared_state WHERE name = ?", (name,)).fetchone()
+            version = row[0] if row is not None else 0
+            if entry is not None and entry[0] == version:
+                value = entry[1]
+            elif version == 0:
+                value = None
+            else:
+                # 两次查询之间有新的发布时，以与数据一同读到的版本号为准
+                version, data = conn.execute("SELECT version, data FROM shared_state WHERE name = ?",
+                                             (name,)).fetchone()
+                value = json.loads(data)
+        finally:
+            conn.close()
+
+        with self._lock:
+            current = self._entries.get(name)
+            # 并发刷新时保留较新的版本（如本进程刚发布的值）
+            if current is None or current[0] <= version:
+                self._entries[name] = (version, value, now + self.check_interval)
+                return version, value
+            return current[:2]
@@ -0,0 +1,118 @@
+"""过期后仍可读的缓存（stale-while-revalidate）
+
+条目在 ttl 内直接返回；过期后在 max_stale 内继续返回旧值，同时在后台只发起一次刷新，
+请求线程不等待刷新。尚无值或超过 max_stale 时才同步加载，同一键的并发请求只加载一次
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Revalidator:
+    """后台刷新任务：同一键同时只有一个刷新在执行，可在多线程间共享"""
+
+    def __init__(self, max_workers, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix='revalidate')
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def submit(self, key, fn):
+        """在后台执行 fn()；该键的刷新仍在执行时忽略。返回是否提交了新任务"""
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+        self._pool.submit(self._run, key, fn)
+        return True
+
+    def _run(self, key, fn):
+        try:
+            fn()
+        except Exception as e:
+            self.logger.warning(f"后台刷新 {key} 失败: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+
+class SWRCache:
+    """stale-while-revalidate 缓存，可在多线程间共享
+
+    max_entries 限制条目数（按最近使用淘汰），on_update(key, value) 在每次写入新值后调用
+    """
+
+    def __init__(self, ttl, max_stale, max_entries=None, max_workers=1, on_update=None):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.on_update = on_update
+        self._revalidator = Revalidator(max_workers)
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entries = OrderedDict()  # key -> (value, fresh_until, expires_at)
+        self._loading = {}  # key -> 同步加载锁
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, loader):
+        """返回 key 的值，需要加载或刷新时调用 loader()"""
+        entry = self._lookup(key)
+        if entry is not None:
+            value, fresh_until, expires_at = entry
+            now = time.monotonic()
+            if now < fresh_until:
+                return value
+            if now < expires_at:
+                self._revalidator.submit(key, lambda: self._load(key, loader))
+                return value
+        return self._load_sync(key, loader)
+
+    def put(self, key, value, version=None):
+        """写入新值；version 为加载开始时的版本，加载期间缓存被置为过期时写入的值仍视为过期"""
+        now = time.monotonic()
+        with self._lock:
+            fresh_until = now + self.ttl if version in (None, self._version) else now
+            self._entries[key] = (value, fresh_until, now + self.max_stale)
+            self._entries.move_to_end(key)
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self.on_update is not None:
+            self.on_update(key, value)
+
+    def invalidate(self):
+        """将全部条目置为过期：仍可返回旧值，下次读取时在后台刷新"""
+        with self._lock:
+            self._version += 1
+            for key, (value, _, expires_at) in self._entries.items():
+                self._entries[key] = (value, 0, expires_at)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _load(self, key, loader):
+        version = self._version
+        value = loader()
+        self.put(key, value, version)
+        return value
+
+    def _load_sync(self, key, loader):
+        with self._lock:
+            lock = self._loading.setdefault(key, threading.Lock())
+        with lock:
+            try:
+                # 等待期间其他线程已加载完成时直接返回
+                entry = self._lookup(key)
+                if entry is not None and time.monotonic() < entry[2]:
+                    return entry[0]
+                return self._load(key, loader)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
@@ -0,0 +1,98 @@
+"""内存符号搜索索引
+
+按代码、名称和名称拼音首字母建立有序数组，前缀查找用二分，
+子串查找在拼接后的字符串上用 str.find 完成，避免逐行扫描数据库
+"""
+from bisect import bisect_left, bisect_right
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:  # 未安装 pypinyin 时不支持拼音首字母搜索
+    lazy_pinyin = None
+
+# 匹配等级：精确 > 前缀 > 子串
+RANK_EXACT = 0
+RANK_PREFIX = 1
+RANK_SUBSTRING = 2
+
+
+def pinyin_initials(name):
+    """返回中文名称的拼音首字母（小写），未安装 pypinyin 时返回空字符串"""
+    if lazy_pinyin is None or not name:
+        return ""
+    return "".join(lazy_pinyin(name, style=Style.FIRST_LETTER)).lower()
+
+
+class SymbolIndex:
+    """股票/期货符号的内存搜索索引，构建后只读，可在多线程间共享"""
+
+    def __init__(self, stocks, futures):
+        """stocks/futures 为 (代码, 名称, 交易所) 序列"""
+        self.entries = []
+        for symbol_type, rows in (("stock", stocks), ("future", futures)):
+            for code, name, exchange in rows:
+                self.entries.append((str(code), name or "", exchange, symbol_type))
+        self.entries.sort(key=lambda entry: entry[0])
+
+        # 每个条目的检索键：代码、名称、拼音首字母（均为小写）
+        keys = []
+        lines = []
+        self._offsets = []
+        offset = 0
+        for entry_id, (code, name, _, _) in enumerate(self.entries):
+            fields = (code.lower(), name.lower(), pinyin_initials(name))
+            keys.extend((key, entry_id) for key in fields if key)
+
+            # 子串查找用的拼接字符串，每个条目一行
+            line = "\t".join(fields)
+            self._offsets.append(offset)
+            lines.append(line)
+            offset += len(line) + 1
+        keys.sort()
+        self._keys = [key for key, _ in keys]
+        self._ids = [entry_id for _, entry_id in keys]
+        self._haystack = "\n".join(lines)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query, exchange="", symbol_type="", limit=30):
+        """按 精确 > 前缀 > 子串 的顺序返回匹配的 (代码, 名称, 交易所, 类型)"""
+        query = query.strip().lower()
+
+        def accept(entry_id):
+            _, _, entry_exchange, entry_type = self.entries[entry_id]
+            return (not exchange or entry_exchange == exchange) and \
+                (not symbol_type or entry_type == symbol_type)
+
+        if not query:
+            results = []
+            for entry_id in range(len(self.entries)):
+                if accept(entry_id):
+                    results.append(self.entries[entry_id])
+                    if len(results) >= limit:
+                        break
+            return results
+
+        ranks = {}
+
+        # 精确与前缀：有序键上二分出以 query 开头的一段，精确匹配的键排在最前，找够即可停止
+        i = bisect_left(self._keys, query)
+        while i < len(self._keys) and len(ranks) < limit and self._keys[i].startswith(query):
+            entry_id = self._ids[i]
+            if entry_id not in ranks and accept(entry_id):
+                ranks[entry_id] = RANK_EXACT if self._keys[i] == query else RANK_PREFIX
+            i += 1
+
+        # 子串：前两级不足 limit 时才查找；行按代码有序，找够即可停止
+        position = self._haystack.find(query) if len(ranks) < limit else -1
+        while position != -1 and len(ranks) < limit:
+            entry_id = bisect_right(self._offsets, position) - 1
+            if entry_id not in ranks and accept(entry_id):
+                ranks[entry_id] = RANK_SUBSTRING
+            # 跳到下一行继续查找
+            next_line = self._offsets[entry_id + 1] if entry_id + 1 < len(self._offsets) else len(self._haystack)
+            position = self._haystack.find(query, next_line)
+
+        # 字典按发现顺序即为 精确 > 前缀（按键排序）> 子串（按代码排序）
+        return [self.entries[entry_id] for entry_id in ranks]
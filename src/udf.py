@@ -1,30 +1,78 @@
 import os
 import sys
 import time
-import sqlite3
+import queue
+import hashlib
 import logging
-from datetime import datetime, timedelta
 import threading
 import akshare as ak
+import numpy as np
 import pandas as pd
-from flask import Blueprint, request, jsonify, current_app
-from functools import wraps
+from flask import Blueprint, Response, request, jsonify, current_app
+from symbol_index import SymbolIndex
+from bar_buffer import BarCache, BYTES_PER_BAR
+from bar_archive import BarArchive
+from fetch_scheduler import FetchScheduler
+from swr_cache import SWRCache, Revalidator
+from db_pool import ConnectionPool
+from db_writer import WriteBehindQueue
+from shared_state import SharedState
+from leader import LeaderElection
+from history_codec import (encode_history_json, encode_history_binary, encode_bulk_frame, compress_body,
+                           BINARY_MIMETYPE, PRICE_DTYPES)
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from itertools import repeat, islice
 
 # 初始化蓝图
 udf_bp = Blueprint('udf', __name__)
 
-# 全局缓存
-STOCK_LIST_CACHE = []
-FUTURES_LIST_CACHE = []
-LAST_CACHE_UPDATE = 0
+# 全局缓存：过期后仍返回旧值并在后台刷新，超过硬过期时间才同步重新加载
 CACHE_EXPIRY = 3600  # 缓存过期时间（秒）
+CACHE_MAX_STALE = 86400  # 硬过期时间（秒）
+SYMBOL_LISTS = SWRCache(ttl=CACHE_EXPIRY, max_stale=CACHE_MAX_STALE,
+                        on_update=lambda key, value: RESPONSE_CACHE.discard(('symbols_list',)))
+SYMBOL_INFO = SWRCache(ttl=CACHE_EXPIRY, max_stale=CACHE_MAX_STALE, max_entries=20000, max_workers=2,
+                       on_update=lambda key, value: RESPONSE_CACHE.discard(('symbols', key)))
+SEARCH_INDEX = None  # 符号搜索索引，随符号列表更新整体替换
+SYMBOLS_VERSION = None  # 本进程符号缓存对应的共享版本号，其他进程更新符号表后据此重新加载
+SHARED_RELOAD = Revalidator(max_workers=1)
+
+
+# 运行时数据目录（数据库、K线归档、选主锁文件），可由环境变量 UDF_DATA_DIR 指定，默认为本文件所在目录
+DATA_DIR = os.environ.get('UDF_DATA_DIR') or os.path.dirname(os.path.abspath(__file__))
+os.makedirs(DATA_DIR, exist_ok=True)
+
+# 数据库连接池（WAL 模式，连接复用）
+DB_PATH = os.path.join(DATA_DIR, 'symbols.db')
+DB_POOL = ConnectionPool(DB_PATH)
+
+# 单写线程：写操作排队后分批提交。队列上限（操作数）、每批行数、攒批的最长等待（秒）
+WRITE_QUEUE_SIZE = 1000
+WRITE_BATCH_ROWS = 50000
+WRITE_MAX_LATENCY = 0.05
+# 请求线程排入写操作的最长等待（秒），超时则放弃本次落库（数据仍返回给客户端，下次重新获取）
+WRITE_QUEUE_TIMEOUT = 1
+DB_WRITER = WriteBehindQueue(DB_POOL.acquire, WRITE_QUEUE_SIZE, WRITE_BATCH_ROWS, WRITE_MAX_LATENCY)
+
+# 已结束月份的K线归档（列式文件，内存映射读取），近期数据留在 history_bars
+ARCHIVE_DIR = os.path.join(DATA_DIR, 'data', 'archive')
+ARCHIVE = BarArchive(ARCHIVE_DIR)
+ARCHIVE_RETIRED = {}  # 序列ID -> (重写后保留的版本, 重写时刻)，旧版本超过宽限期后才删除
+ARCHIVE_RETIRE_GRACE = 600  # 旧版本的保留时间（秒），留给按旧清单读取中的请求（含其他工作进程）
+
+# 多进程部署：符号列表变更通知与行情快照经数据库在工作进程间共享（每秒最多检查一次版本号），
+# 后台更新线程只在竞选成功的一个进程中运行
+SHARED_STATE_CHECK_INTERVAL = 1
+SHARED_STATE = SharedState(DB_POOL.acquire, DB_WRITER.submit, SHARED_STATE_CHECK_INTERVAL)
+UPDATER_ELECTION = LeaderElection(os.path.join(DATA_DIR, 'updater.lock'))
 
 
 # 数据库初始化
 def init_db():
     """初始化数据库表结构"""
-    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'symbols.db')
-    conn = sqlite3.connect(db_path)
+    conn = get_db_connection()
     cursor = conn.cursor()
 
     # 已有的股票表和期货表...
@@ -60,14 +108,32 @@ def init_db():
                    )
                    ''')
 
-    # 添加历史数据表
+    # K线序列：(symbol, resolution) -> 整数序列ID，K线行只存序列ID
     cursor.execute('''
-                   CREATE TABLE IF NOT EXISTS history_data
+                   CREATE TABLE IF NOT EXISTS history_series
                    (
+                       series_id
+                       INTEGER
+                       PRIMARY
+                       KEY,
                        symbol
                        TEXT,
                        resolution
                        TEXT,
+                       UNIQUE
+                   (
+                       symbol,
+                       resolution
+                   )
+                       )
+                   ''')
+
+    # 历史数据表：按 (序列ID, 时间戳) 聚簇存储（WITHOUT ROWID，无需额外的主键索引）
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS history_bars
+                   (
+                       series_id
+                       INTEGER,
                        timestamp
                        INTEGER,
                        open
@@ -82,24 +148,266 @@ def init_db():
                        INTEGER,
                        PRIMARY
                        KEY
+                   (
+                       series_id,
+                       timestamp
+                   )
+                       ) WITHOUT ROWID
+                   ''')
+
+    # 迁移旧版每行存储 symbol/resolution 的 history_data
+    migrate = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history_data'").fetchone() is not None
+    if migrate:
+        cursor.execute('''
+        INSERT OR IGNORE INTO history_series (symbol, resolution)
+        SELECT DISTINCT symbol, resolution FROM history_data
+        ''')
+        cursor.execute('''
+        INSERT OR REPLACE INTO history_bars (series_id, timestamp, open, high, low, close, volume)
+        SELECT s.series_id, d.timestamp, d.open, d.high, d.low, d.close, d.volume
+        FROM history_data d JOIN history_series s ON s.symbol = d.symbol AND s.resolution = d.resolution
+        ''')
+        cursor.execute("DROP TABLE history_data")
+
+    # 归档清单：每个序列每月一行，记录该月K线在归档文件中的行范围
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS history_archive
+                   (
+                       series_id
+                       INTEGER,
+                       month
+                       INTEGER,
+                       version
+                       INTEGER,
+                       row_start
+                       INTEGER,
+                       row_count
+                       INTEGER,
+                       first_time
+                       INTEGER,
+                       last_time
+                       INTEGER,
+                       PRIMARY
+                       KEY
+                   (
+                       series_id,
+                       month
+                   )
+                       ) WITHOUT ROWID
+                   ''')
+
+    # 已从上游获取过的区间（用于判断history_bars是否覆盖请求范围）
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS history_coverage
+                   (
+                       symbol
+                       TEXT,
+                       resolution
+                       TEXT,
+                       range_start
+                       INTEGER,
+                       range_end
+                       INTEGER,
+                       PRIMARY
+                       KEY
                    (
                        symbol,
                        resolution,
-                       timestamp
+                       range_start
+                   )
+                       )
+                   ''')
+
+    # K线访问统计（预热调度器据此选出热点符号）
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS symbol_access
+                   (
+                       symbol
+                       TEXT,
+                       resolution
+                       TEXT,
+                       hits
+                       INTEGER,
+                       last_access
+                       INTEGER,
+                       PRIMARY
+                       KEY
+                   (
+                       symbol,
+                       resolution
                    )
                        )
                    ''')
 
+    # 深度历史回补进度（next_end 之前尚未回补，done=1 表示已回补到上市日）
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS backfill_progress
+                   (
+                       symbol
+                       TEXT,
+                       resolution
+                       TEXT,
+                       next_end
+                       INTEGER,
+                       done
+                       INTEGER,
+                       update_time
+                       INTEGER,
+                       PRIMARY
+                       KEY
+                   (
+                       symbol,
+                       resolution
+                   )
+                       )
+                   ''')
+
+    # 工作进程间共享的状态（JSON）与版本号
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS shared_state
+                   (
+                       name
+                       TEXT
+                       PRIMARY
+                       KEY,
+                       version
+                       INTEGER,
+                       data
+                       TEXT,
+                       update_time
+                       INTEGER
+                   )
+                   ''')
+
+    # 近期被请求报价的符号（各工作进程汇总，后台任务进程只刷新这些符号的行情）
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS quote_requests
+                   (
+                       symbol
+                       TEXT
+                       PRIMARY
+                       KEY,
+                       request_time
+                       INTEGER
+                   )
+                   ''')
+
     conn.commit()
+    if migrate:
+        # 回收旧表占用的空间（只在迁移时执行一次）
+        conn.execute("VACUUM")
+        current_app.logger.info("history_data 已迁移到 history_bars")
     conn.close()
 
 
 def get_db_connection():
-    """获取数据库连接"""
-    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'symbols.db')
-    conn = sqlite3.connect(db_path, timeout=10)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """从连接池获取数据库连接，close() 时归还"""
+    return DB_POOL.acquire()
+
+
+def submit_write(fn, weight=1, timeout=None, exclusive=False):
+    """将写操作 fn(conn) 排入单写线程（在当前应用上下文中执行），返回提交后完成的 Future"""
+    return DB_WRITER.submit(with_app_context(fn), weight, timeout, exclusive)
+
+
+def get_series_id(conn, symbol, resolution):
+    """返回 (symbol, resolution) 的序列ID，不存在时创建（在调用方的事务中）"""
+    conn.execute("INSERT OR IGNORE INTO history_series (symbol, resolution) VALUES (?, ?)", (symbol, resolution))
+    return conn.execute("SELECT series_id FROM history_series WHERE symbol = ? AND resolution = ?",
+                        (symbol, resolution)).fetchone()[0]
+
+
+def bulk_upsert(conn, table, data, constants=None):
+    """列式批量写入：DataFrame 或 {列名: 数组} 按列打包后一次 executemany
+
+    constants 为每行相同的列（如 symbol、resolution）。不在此处提交，
+    由调用方在同一事务中 commit。返回写入条数
+    """
+    if isinstance(data, pd.DataFrame):
+        data = {col: data[col] for col in data.columns}
+    columns = list(data)
+    # numpy 标量无法直接绑定到 sqlite3 参数，tolist() 一次性转换为Python原生类型
+    arrays = [np.asarray(data[col]).tolist() for col in columns]
+    count = len(arrays[0]) if arrays else 0
+    if count == 0:
+        return 0
+
+    for col, value in (constants or {}).items():
+        columns.append(col)
+        arrays.append(repeat(value, count))
+
+    start = time.perf_counter()
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+        zip(*arrays))
+    elapsed = time.perf_counter() - start
+    current_app.logger.debug(f"批量写入{table}: {count}条，{elapsed:.3f}秒，{count / max(elapsed, 1e-6):.0f}条/秒")
+    return count
+
+
+def save_symbols(conn, table, codes, names, exchanges, update_time):
+    """按列批量写入 stocks/futures 表，返回写入条数"""
+    return bulk_upsert(conn, table, {'code': codes, 'name': names, 'exchange': exchanges},
+                       constants={'update_time': update_time})
+
+
+class ResponseCache:
+    """预编码的JSON响应缓存（响应体字节 + ETag），按最近使用淘汰，符号列表更新时整体失效"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._generation = 0  # 整体失效的次数
+        self._versions = {}  # key -> 单独失效的次数
+        self._entries = OrderedDict()
+
+    def get(self, key, build):
+        """返回 (body, etag)，未命中时调用 build() 生成响应对象并编码缓存"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            version = (self._generation, self._versions.get(key, 0))
+
+        body = current_app.json.dumps(build()).encode('utf-8')
+        entry = (body, hashlib.sha1(body).hexdigest())
+        with self._lock:
+            # 编码期间该键或整个缓存已失效时不写入，避免旧数据覆盖新版本
+            if version == (self._generation, self._versions.get(key, 0)):
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def discard(self, key):
+        with self._lock:
+            # 同时使该键正在编码的响应不写入，避免用刚被替换的数据重新缓存；其他键不受影响
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._entries.pop(key, None)
+
+    def invalidate(self):
+        """整体失效，正在编码的响应均不写入"""
+        with self._lock:
+            self._generation += 1
+            self._versions = {}
+            self._entries = OrderedDict()
+
+
+RESPONSE_CACHE = ResponseCache(max_entries=20000)
+
+
+def cached_json_response(key, build):
+    """返回缓存的JSON响应，带ETag，If-None-Match 命中时返回304"""
+    body, etag = RESPONSE_CACHE.get(key, build)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
 
 
 def error_handler(f):
@@ -116,105 +424,995 @@ def error_handler(f):
     return wrapper
 
 
-def fetch_and_save_history_data(symbol, resolution):
-    """从AKShare获取数据并保存到数据库"""
+def with_app_context(fn):
+    """包装为在当前应用上下文中执行的函数，供后台线程调用"""
+    app = current_app._get_current_object()
+
+    def run(*args, **kwargs):
+        with app.app_context():
+            return fn(*args, **kwargs)
+
+    return run
+
+
+# TradingView 周期 -> AKShare 周期（上游直接提供并落库的基础周期）
+PERIOD_MAP = {
+    "1": "1",  # 1分钟
+    "5": "5",  # 5分钟
+    "15": "15",  # 15分钟
+    "30": "30",  # 30分钟
+    "60": "60",  # 60分钟
+    "D": "daily",  # 日线
+}
+
+# 分钟级基础周期，由大到小选取能整除目标周期的作为聚合来源
+INTRADAY_BASES = (60, 30, 15, 5, 1)
+
+# 对外提供的周期（基础周期之外的均由基础周期在服务端聚合）
+SUPPORTED_RESOLUTIONS = ["1", "3", "5", "10", "15", "30", "45", "60", "120", "240",
+                         "D", "1D", "2D", "W", "M"]
+
+# 交易时段（与 /symbols 返回一致），夜盘归属下一交易日
+STOCK_SESSION = "0930-1130,1300-1500"
+FUTURES_SESSION = "0900-1015,1030-1130,1330-1500,2100-2300"
+
+# 交易所所在时区，分钟线时间按此时区解释
+MARKET_TZ = 'Asia/Shanghai'
+EPOCH = pd.Timestamp(0, tz='UTC')
+
+STOCK_EXCHANGES = ['SSE', 'SZSE', 'BSE']
+FUTURES_EXCHANGES = ['CFFEX', 'SHFE', 'DCE', 'CZCE', 'INE', 'GFEX']
+
+# 缺口小于该值（秒）时视为已覆盖，避免最新一根K线每次请求都回源
+HISTORY_REFRESH_INTERVAL = 60
+# 内存缓冲区尾部过期但未超过该时长（秒）时先返回缓冲区数据，由后台补齐尾部
+HISTORY_MAX_STALE = 600
+BAR_TAIL_REFRESH = Revalidator(max_workers=4)
+
+BAR_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+
+def parse_resolution(resolution):
+    """解析TradingView周期，返回 (单位, 倍数)，单位为 'min'/'D'/'W'/'M'，无法解析时返回None"""
+    resolution = str(resolution).strip().upper()
+    if resolution.isdigit():
+        return ('min', int(resolution)) if int(resolution) > 0 else None
+
+    unit, count = resolution[-1:], resolution[:-1] or '1'
+    if unit in ('D', 'W', 'M') and count.isdigit() and int(count) > 0:
+        return unit, int(count)
+    return None
+
+
+def normalize_resolution(resolution):
+    """归一化周期写法（如 1D -> D），不支持的周期返回None"""
+    parsed = parse_resolution(resolution)
+    if parsed is None:
+        return None
+    unit, count = parsed
+    if unit == 'min':
+        return str(count)
+    return unit if count == 1 else f"{count}{unit}"
+
+
+def resolution_base(resolution):
+    """返回用于聚合该周期的基础周期（已归一化的周期）"""
+    if resolution in PERIOD_MAP:
+        return resolution
+    unit, count = parse_resolution(resolution)
+    if unit == 'min':
+        return str(next(base for base in INTRADAY_BASES if count % base == 0))
+    return "D"
+
+
+def resolution_seconds(resolution):
+    """周期的近似时长（秒），用于估算聚合时需要向前多取的基础K线"""
+    unit, count = parse_resolution(resolution)
+    return count * {'min': 60, 'D': 86400, 'W': 7 * 86400, 'M': 31 * 86400}[unit]
+
+
+def parse_session(session):
+    """解析 "0930-1130,1300-1500" 格式的交易时段，返回按时间排序的 [(开始分钟, 结束分钟)]
+
+    夜盘（18:00之后开始）折算为负数分钟，排在当日日盘之前
+    """
+    spans = []
+    for part in session.split(','):
+        start, end = part.split('-')
+        start = int(start[:2]) * 60 + int(start[2:])
+        end = int(end[:2]) * 60 + int(end[2:])
+        if end <= start:  # 跨午夜的夜盘
+            end += 1440
+        if start >= 18 * 60:
+            start, end = start - 1440, end - 1440
+        spans.append((start, end))
+    return sorted(spans)
+
+
+def session_positions(timestamps, session):
+    """计算每根分钟级K线所属交易日（天数）及其在交易时段内的分钟序号
+
+    K线时间为该分钟结束时刻（如 09:31 表示 09:30-09:31），时段外的K线归入之前最近的时段
+    """
+    local = pd.to_datetime(timestamps, unit='s', utc=True).tz_convert(MARKET_TZ)
+    clock = (local.hour * 60 + local.minute).to_numpy()
+    night = clock >= 18 * 60
+    clock = np.where(night, clock - 1440, clock)
+
+    # 夜盘归属下一交易日，周末顺延到周一
+    day = local.tz_localize(None).normalize().to_numpy().astype('datetime64[D]')
+    day = np.busday_offset(day, night.astype('int64'), roll='forward')
+
+    index = np.zeros(len(clock), dtype='int64')
+    offset = 0
+    for start, end in parse_session(session):
+        index = np.where(clock >= start, offset + np.clip(clock - start - 1, 0, end - start - 1), index)
+        offset += end - start
+    return day.astype('int64'), index, clock
+
+
+def session_clock(index, session):
+    """session_positions 的逆运算：时段内分钟序号 -> 该分钟结束时刻（分钟）"""
+    clock = np.zeros(len(index), dtype='int64')
+    offset = 0
+    for start, end in parse_session(session):
+        clock = np.where(index >= offset, start + (index - offset) + 1, clock)
+        offset += end - start
+    return clock
+
+
+def session_minutes(session):
+    """交易时段的总分钟数"""
+    return sum(end - start for start, end in parse_session(session))
+
+
+def aggregate_bars(bars, resolution, session, from_time=None, to_time=None):
+    """将基础周期K线向量化聚合为目标周期，只返回与 [from_time, to_time] 有交集的K线
+
+    分钟级按交易时段对齐（不跨交易日），K线时间为该周期结束时刻；
+    日线以上按交易日/自然周/自然月分组，K线时间为组内第一根日线的时间
+    """
+    if bars.empty:
+        return bars
+
+    t = bars['timestamp'].to_numpy()
+    unit, count = parse_resolution(resolution)
+    if unit == 'min':
+        day, index, clock = session_positions(t, session)
+        keys = day * 100000 + index // count
+    else:
+        day = (t // 86400).astype('datetime64[D]')
+        if unit == 'D':
+            keys = np.busday_count(np.datetime64('1970-01-05'), day) // count
+        elif unit == 'W':
+            keys = (day.astype('int64') - 4) // 7 // count  # 1970-01-05 为周一
+        else:
+            keys = day.astype('datetime64[M]').astype('int64') // count
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+
+    if unit == 'min':
+        # 以组内最后一根K线推算周期结束时刻，跨午休/夜盘时按时段换算
+        close_index = np.minimum((index[ends] // count + 1) * count, session_minutes(session)) - 1
+        labels = t[ends] + (session_clock(close_index, session) - clock[ends]) * 60
+    else:
+        labels = t[starts]
+
+    result = pd.DataFrame({
+        'timestamp': labels,
+        'open': bars['open'].to_numpy()[starts],
+        'high': np.maximum.reduceat(bars['high'].to_numpy(), starts),
+        'low': np.minimum.reduceat(bars['low'].to_numpy(), starts),
+        'close': bars['close'].to_numpy()[ends],
+        'volume': np.add.reduceat(bars['volume'].to_numpy(), starts),
+    })
+
+    # 组的首/末K线时间均有序，二分查找与区间有交集的连续一段
+    lo = np.searchsorted(t[ends], from_time, side='left') if from_time is not None else 0
+    hi = np.searchsorted(t[starts], to_time, side='right') if to_time is not None else len(result)
+    return result.iloc[lo:hi].reset_index(drop=True)
+
+
+def slice_bars(bars, from_time=None, to_time=None, countback=None):
+    """按时间二分查找截取已排序的K线；指定 countback 时返回 to_time 之前（含）的最后 countback 根"""
+    t = bars['timestamp'].to_numpy()
+    end = np.searchsorted(t, to_time, side='right') if to_time is not None else len(t)
+    if countback:
+        start = max(end - countback, 0)
+    else:
+        start = np.searchsorted(t, from_time, side='left') if from_time is not None else 0
+    return bars.iloc[start:end].reset_index(drop=True)
+
+
+def parse_symbol(symbol):
+    """解析 交易所:代码 格式的符号，返回 (交易所, 代码, AKShare代码)"""
+    exchange, code = symbol.split(':', 1)
+
+    # 转换股票代码格式（AKShare需要特定前缀）
+    adjusted_code = code
+    if exchange == "SSE":
+        adjusted_code = f"sh{code}"
+    elif exchange == "SZSE":
+        adjusted_code = f"sz{code}"
+    return exchange, code, adjusted_code
+
+
+def to_unix_seconds(values, intraday):
+    """向量化地将日期/时间列转换为Unix时间戳（秒）
+
+    分钟线的无时区时间按北京时间（Asia/Shanghai）解释；日线及以上只有日期，
+    按UDF约定取该日期 00:00 UTC
+    """
+    dt = pd.to_datetime(pd.Series(values), errors='coerce')
+    if dt.dt.tz is None:
+        dt = dt.dt.tz_localize(MARKET_TZ if intraday else 'UTC')
+    return ((dt - EPOCH) // pd.Timedelta(seconds=1)).to_numpy()
+
+
+def timestamp_to_date(timestamp):
+    """将Unix时间戳转换为北京时间的 YYYYMMDD 字符串（AKShare日期参数格式）"""
+    return pd.Timestamp(timestamp, unit='s', tz='UTC').tz_convert(MARKET_TZ).strftime('%Y%m%d')
+
+
+def normalize_bars(df, resolution):
+    """将AKShare返回的数据整理为 timestamp/open/high/low/close/volume 标准列"""
+    # 确定时间列，优先处理分钟线特有的 `day` 列
+    time_col = next((col for col in ['day', '日期', '时间', 'date'] if col in df.columns), None)
+    if time_col is None:
+        # 尝试自动识别日期列（包含 day、date、time 等关键词）
+        time_col = next((col for col in df.columns if
+                         'date' in str(col).lower() or
+                         'time' in str(col).lower() or
+                         'day' in str(col).lower()), None)
+    if time_col is None:
+        raise ValueError("未找到日期列（day/日期/时间），无法转换时间戳")
+
+    # 映射价格和成交量列（处理不同数据源的列名差异）
+    price_cols = {
+        'open': ['开盘', 'open', '开盘价'],
+        'high': ['最高', 'high', '最高价'],
+        'low': ['最低', 'low', '最低价'],
+        'close': ['收盘', 'close', '收盘价'],
+        'volume': ['成交量', 'volume', '成交']
+    }
+
+    columns = {'timestamp': to_unix_seconds(df[time_col], resolution.isdigit())}
+    for key, possible_cols in price_cols.items():
+        found_col = next((col for col in possible_cols if col in df.columns), None)
+        if found_col is None:
+            if key != 'volume':
+                raise ValueError(f"数据列不完整，缺少{key}列")
+            columns[key] = np.zeros(len(df), dtype='int64')
+        else:
+            columns[key] = pd.to_numeric(df[found_col], errors='coerce').fillna(0).to_numpy(dtype='float64')
+    columns['volume'] = columns['volume'].astype('int64')
+
+    bars = pd.DataFrame(columns).dropna(subset=['timestamp'])  # 丢弃无法解析的时间（NaT）
+    bars['timestamp'] = bars['timestamp'].astype('int64')
+    return bars.drop_duplicates('timestamp', keep='last').sort_values('timestamp').reset_index(drop=True)
+
+
+def fetch_upstream_bars(symbol, resolution, from_time=None, to_time=None):
+    """从AKShare获取K线并整理为标准列，from_time/to_time为空时获取全部历史
+
+    上游异常直接抛出，由调用方区分“获取失败”与“无数据”
+    """
+    exchange, code, adjusted_code = parse_symbol(symbol)
+    ak_period = PERIOD_MAP[resolution]
+
+    # 转换时间格式为AKShare需要的字符串（YYYYMMDD）
+    date_kwargs = {}
+    if from_time is not None:
+        date_kwargs['start_date'] = timestamp_to_date(from_time)
+    if to_time is not None:
+        date_kwargs['end_date'] = timestamp_to_date(to_time)
+
+    df = None
+    if exchange in STOCK_EXCHANGES:  # 股票
+        if ak_period == "daily":
+            df = ak.stock_zh_a_daily(symbol=adjusted_code, **date_kwargs)
+        else:  # 分钟线（上游不支持日期范围，返回最近的全部数据）
+            df = ak.stock_zh_a_minute(symbol=adjusted_code, period=ak_period)
+
+    elif exchange in FUTURES_EXCHANGES:  # 期货
+        df = ak.futures_zh_daily(symbol=code, **date_kwargs)
+
+    if df is None or df.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    return normalize_bars(df, resolution)
+
+
+def save_bars(conn, symbol, resolution, bars):
+    """将标准列K线写入history_bars，返回写入条数"""
+    if bars.empty:
+        return 0
+    return bulk_upsert(conn, 'history_bars', bars[BAR_COLUMNS],
+                       constants={'series_id': get_series_id(conn, symbol, resolution)})
+
+
+def load_bars(conn, symbol, resolution, from_time, to_time):
+    """读取指定区间的K线：已归档的月份映射归档文件，其余从history_bars读取"""
+    # 归档清单与库内K线在同一个读事务（快照）中读取，归档搬移过程中不会两边都读不到
+    snapshot = not conn.in_transaction
+    for attempt in range(2):
+        if snapshot:
+            conn.execute("BEGIN")
+        try:
+            archived = load_archived_bars(conn, symbol, resolution, from_time, to_time)
+            bars = pd.read_sql_query('''
+            SELECT timestamp, open, high, low, close, volume FROM history_bars
+            WHERE series_id = (SELECT series_id FROM history_series WHERE symbol = ? AND resolution = ?)
+              AND timestamp BETWEEN ? AND ?
+            ORDER BY timestamp
+            ''', conn, params=(symbol, resolution, from_time, to_time))
+            break
+        except FileNotFoundError:
+            # 快照中的归档版本已超过宽限期被删除：开启新的快照按当前版本重读
+            if not snapshot or attempt:
+                raise
+        finally:
+            if snapshot:
+                conn.rollback()
+
+    # 只涉及归档月份时直接返回映射的列，不复制
+    if archived is None or archived.empty:
+        return bars
+    if bars.empty:
+        return archived
+    return merge_bars(archived, [bars], from_time, to_time)
+
+
+def load_archived_bars(conn, symbol, resolution, from_time, to_time):
+    """从归档读取 [from_time, to_time] 内的K线，区间内没有归档月份时返回None"""
+    row = conn.execute('''
+    SELECT a.series_id, MAX(a.version), MIN(a.row_start), MAX(a.row_start + a.row_count)
+    FROM history_archive a JOIN history_series s ON s.series_id = a.series_id
+    WHERE s.symbol = ? AND s.resolution = ? AND a.last_time >= ? AND a.first_time <= ?
+    ''', (symbol, resolution, from_time, to_time)).fetchone()
+    if row[0] is None:
+        return None
+    series_id, version, row_start, row_end = row
+    return ARCHIVE.read(series_id, version, row_start, row_end, from_time, to_time)
+
+
+def load_archived_month(conn, symbol, resolution, before):
+    """读取归档中 before 之前最后一个月的K线，没有时返回None"""
+    for attempt in range(2):
+        row = conn.execute('''
+        SELECT a.series_id, a.version, a.row_start, a.row_count
+        FROM history_archive a JOIN history_series s ON s.series_id = a.series_id
+        WHERE s.symbol = ? AND s.resolution = ? AND a.first_time < ?
+        ORDER BY a.month DESC LIMIT 1
+        ''', (symbol, resolution, before)).fetchone()
+        if row is None:
+            return None
+        series_id, version, row_start, row_count = row
+        try:
+            bars = ARCHIVE.read(series_id, version, row_start, row_start + row_count, 0, before - 1)
+            return bars if not bars.empty else None
+        except FileNotFoundError:
+            # 读到的版本已被删除：不在事务中时重新查询清单即得到当前版本
+            if conn.in_transaction or attempt:
+                raise
+
+
+def get_missing_ranges(conn, symbol, resolution, from_time, to_time):
+    """计算 [from_time, to_time] 中尚未从上游获取过的区间"""
+    cursor = conn.execute('''
+    SELECT range_start, range_end FROM history_coverage
+    WHERE symbol = ? AND resolution = ? AND range_end >= ? AND range_start <= ?
+    ORDER BY range_start
+    ''', (symbol, resolution, from_time, to_time))
+
+    missing = []
+    position = from_time
+    for range_start, range_end in cursor.fetchall():
+        if range_start > position:
+            missing.append((position, range_start))
+        position = max(position, range_end)
+    if position < to_time:
+        missing.append((position, to_time))
+
+    return [(start, end) for start, end in missing if end - start >= HISTORY_REFRESH_INTERVAL]
+
+
+def add_covered_range(conn, symbol, resolution, range_start, range_end):
+    """记录已从上游获取过的区间，并与重叠/相邻的区间合并"""
+    cursor = conn.execute('''
+    SELECT range_start, range_end FROM history_coverage
+    WHERE symbol = ? AND resolution = ? AND range_end >= ? AND range_start <= ?
+    ''', (symbol, resolution, range_start, range_end))
+    for start, end in cursor.fetchall():
+        range_start = min(range_start, start)
+        range_end = max(range_end, end)
+
+    conn.execute('''
+    DELETE FROM history_coverage
+    WHERE symbol = ? AND resolution = ? AND range_end >= ? AND range_start <= ?
+    ''', (symbol, resolution, range_start, range_end))
+    conn.execute('''
+    INSERT INTO history_coverage (symbol, resolution, range_start, range_end)
+    VALUES (?, ?, ?, ?)
+    ''', (symbol, resolution, range_start, range_end))
+
+
+class SingleFlight:
+    """进程内上游请求合并
+
+    同一序列上已有覆盖本次区间的请求在执行时，后到的请求等待其完成并共享结果（结果可能尚未落库）；
+    返回空数据的区间在 negative_ttl 秒内不再回源（仅针对完全落在该区间内的请求）
+    """
+
+    def __init__(self, negative_ttl, wait_timeout):
+        self.negative_ttl = negative_ttl
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> [进行中的请求]
+        self._empty = {}  # key -> [(区间起点, 区间终点, 过期时间)]
+
+    def do(self, key, start, end, fn):
+        """执行 fn() 获取 [start, end] 的数据，返回 fn 的结果（被合并时为合并请求的结果）；命中负缓存时返回None"""
+        with self._lock:
+            now = time.time()
+            if any(empty_start <= start and end <= empty_end and expires > now
+                   for empty_start, empty_end, expires in self._empty.get(key, ())):
+                return None
+
+            call = next((c for c in self._calls.get(key, [])
+                         if c['start'] <= start and c['end'] + HISTORY_REFRESH_INTERVAL >= end), None)
+            leader = call is None
+            if leader:
+                call = {'start': start, 'end': end, 'event': threading.Event(), 'result': None, 'error': None}
+                self._calls.setdefault(key, []).append(call)
+
+        if not leader:
+            if not call['event'].wait(self.wait_timeout):
+                raise TimeoutError(f"等待上游请求超时: {key}")
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls[key].remove(call)
+                if not self._calls[key]:
+                    del self._calls[key]
+                now = time.time()
+                # 与本次区间重叠的负缓存作废（有数据时）或由本次区间取代，同时清理已过期的
+                empty = [entry for entry in self._empty.get(key, ())
+                         if entry[2] > now and (entry[1] < start or entry[0] > end)]
+                if call['error'] is None and call['result'] is not None and len(call['result']) == 0:
+                    empty.append((start, end, now + self.negative_ttl))
+                if empty:
+                    self._empty[key] = empty
+                else:
+                    self._empty.pop(key, None)
+            call['event'].set()
+
+
+# 上游空结果的负缓存时间（秒）与等待合并请求的超时时间（秒）
+NEGATIVE_CACHE_TTL = 30
+UPSTREAM_WAIT_TIMEOUT = 60
+
+UPSTREAM_FLIGHT = SingleFlight(NEGATIVE_CACHE_TTL, UPSTREAM_WAIT_TIMEOUT)
+
+
+class PendingWrites:
+    """已从上游获取、排入单写线程但尚未提交的区间及其K线
+
+    提交前覆盖记录还查不到这些区间，重复或重叠的请求据此直接使用已获取的K线，不再回源
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> [(区间起点, 区间终点, K线)]
+
+    def add(self, key, start, end, bars):
+        entry = (start, end, bars)
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+        return entry
+
+    def remove(self, key, entry):
+        with self._lock:
+            # 按对象比较，相同区间的K线（DataFrame）不能用 == 比较
+            entries = [e for e in self._entries.get(key, ()) if e is not entry]
+            if entries:
+                self._entries[key] = entries
+            else:
+                self._entries.pop(key, None)
+
+    def overlapping(self, key, start, end):
+        """与 [start, end] 重叠的待提交区间 [(起点, 终点, K线)]"""
+        with self._lock:
+            return [entry for entry in self._entries.get(key, ()) if entry[0] <= end and entry[1] >= start]
+
+
+PENDING_WRITES = PendingWrites()
+
+
+def subtract_ranges(ranges, covered):
+    """从区间列表中扣除已覆盖的区间（按起点排序的 [(起点, 终点, ...)]），忽略过短的剩余部分"""
+    result = []
+    for start, end in ranges:
+        position = start
+        for covered_start, covered_end, *_ in covered:
+            if covered_end < position or covered_start > end:
+                continue
+            if covered_start > position:
+                result.append((position, covered_start))
+            position = max(position, covered_end)
+        if position < end:
+            result.append((position, end))
+    return [(start, end) for start, end in result if end - start >= HISTORY_REFRESH_INTERVAL]
+
+# 热点序列内存缓冲区：总内存预算（字节）与每个序列最多保留的K线根数
+BAR_CACHE_MEMORY = 256 * 1024 * 1024
+BAR_BUFFER_CAPACITY = 20000
+
+BAR_CACHE = BarCache(BAR_CACHE_MEMORY, BAR_BUFFER_CAPACITY)
+
+
+def fill_history_range(symbol, resolution, start, end, fetcher=None):
+    """从上游获取 [start, end] 的K线，排入单写线程落库并记录覆盖区间，返回获取到的K线（不等待落库）
+
+    指定 fetcher 时上游请求经其 'history' 令牌桶限速
+    """
+    if fetcher is None:
+        bars = fetch_upstream_bars(symbol, resolution, start, end)
+    else:
+        bars = fetcher.call('history', lambda: fetch_upstream_bars(symbol, resolution, start, end),
+                            current_app.logger)
+
+    # 上游可能返回比请求更早的数据（如分钟线），覆盖区间随之扩展
+    if not bars.empty:
+        start = min(start, int(bars['timestamp'].iloc[0]))
+
+    def write(conn):
+        save_bars(conn, symbol, resolution, bars)
+        add_covered_range(conn, symbol, resolution, start, end)
+
+    # 提交（或失败）之前由 PENDING_WRITES 代替覆盖记录
+    key = (symbol, resolution)
+    pending = PENDING_WRITES.add(key, start, end, bars)
     try:
-        # 解析符号
-        exchange, code = symbol.split(':', 1)
+        future = submit_write(write, weight=len(bars), timeout=WRITE_QUEUE_TIMEOUT)
+    except queue.Full:
+        PENDING_WRITES.remove(key, pending)
+        current_app.logger.warning(f"写入队列已满，放弃落库: {symbol} ({resolution}) {start}-{end}")
+    else:
+        future.add_done_callback(lambda _: PENDING_WRITES.remove(key, pending))
+    current_app.logger.debug(f"已补齐{symbol}的{resolution}数据: {start}-{end}，{len(bars)}条")
+    return bars
+
+
+def merge_bars(bars, fetched, from_time, to_time):
+    """将刚从上游获取、可能尚未落库的K线合并到读库结果中（时间相同时以上游为准）"""
+    frames = [df[BAR_COLUMNS] for df in fetched if df is not None and not df.empty]
+    if not frames:
+        return bars
+    if not bars.empty:
+        frames.insert(0, bars)
+    merged = pd.concat(frames, ignore_index=True).drop_duplicates('timestamp', keep='last')
+    merged = merged.sort_values('timestamp', ignore_index=True)
+    timestamps = merged['timestamp']
+    return merged[(timestamps >= from_time) & (timestamps <= to_time)].reset_index(drop=True)
+
+
+# countback 不足时向前扩展查询区间的最大次数
+COUNTBACK_MAX_EXTENSIONS = 4
+
+
+def get_history_bars(symbol, resolution, from_time, to_time, countback=None, cache=True, fetcher=None):
+    """获取 [from_time, to_time] 的K线；指定 countback 时至少向前取够 countback 根（如有）
+
+    cache=False 时读到的序列不装入内存缓冲区；指定 fetcher 时补齐缺失区间的上游请求经其限速。
+    返回 (bars, upstream_error)
+    """
+    bars, upstream_error = get_history_window(symbol, resolution, from_time, to_time, cache, fetcher)
+    if not countback:
+        return bars, upstream_error
+
+    # 区间内K线不足时按倍增的步长向前扩展，直到取够或达到扩展次数上限
+    step = max(to_time - from_time, countback * resolution_seconds(resolution))
+    for _ in range(COUNTBACK_MAX_EXTENSIONS):
+        if len(bars) >= countback or from_time <= 0:
+            break
+        from_time = max(from_time - step, 0)
+        step *= 2
+        bars, upstream_error = get_history_window(symbol, resolution, from_time, to_time, cache, fetcher)
+
+    return slice_bars(bars, to_time=to_time, countback=countback), upstream_error
+
+
+def get_next_time(symbol, resolution, before):
+    """返回 before 之前最近一根K线的时间（UDF nextTime），无数据时返回None"""
+    conn = get_db_connection()
+    try:
+        base = resolution_base(resolution)
+        row = conn.execute('''
+        SELECT MAX(timestamp) FROM history_bars
+        WHERE series_id = (SELECT series_id FROM history_series WHERE symbol = ? AND resolution = ?)
+          AND timestamp < ?
+        ''', (symbol, base, before)).fetchone()
+        archived = load_archived_month(conn, symbol, base, before)
+    finally:
+        conn.close()
 
-        # 转换代码格式
-        adjusted_code = code
-        if exchange == "SSE":
-            adjusted_code = f"sh{code}"
-        elif exchange == "SZSE":
-            adjusted_code = f"sz{code}"
-
-        # 转换周期
-        period_map = {
-            # 基础周期
-            "1": "1", "5": "5", "15": "15", "30": "30", "60": "60",
-            "D": "daily", "W": "weekly", "M": "monthly",
-            # 添加 TradingView 可能传递的带数字前缀的周期
-            "1D": "daily",  # 日线（1天）
-            "1W": "weekly",  # 周线（1周）
-            "1M": "monthly"  # 月线（1月）
-        }
-
-        if resolution not in period_map:
-            return False
+    times = [int(archived['timestamp'].iloc[-1])] if archived is not None else []
+    if row[0] is not None:
+        times.append(row[0])
+    return max(times) if times else None
 
-        ak_period = period_map[resolution]
 
-        # 获取数据
-        df = None
-        if exchange in ['SSE', 'SZSE', 'BSE']:  # 股票
-            if ak_period == "daily":
-                df = ak.stock_zh_a_daily(symbol=adjusted_code)
-            elif ak_period == "weekly":
-                df = ak.stock_zh_a_weekly(symbol=adjusted_code)
-            elif ak_period == "monthly":
-                df = ak.stock_zh_a_monthly(symbol=adjusted_code)
-            else:  # 分钟线
-                df = ak.stock_zh_a_minute(symbol=adjusted_code, period=ak_period)
+def get_history_window(symbol, resolution, from_time, to_time, cache=True, fetcher=None):
+    """获取任意周期的K线：基础周期直接读穿缓存，其余周期由基础周期聚合
 
-        elif exchange in ['CFFEX', 'SHFE', 'DCE', 'CZCE']:  # 期货
-            df = ak.futures_zh_daily(symbol=code)
+    返回 (bars, upstream_error)
+    """
+    base = resolution_base(resolution)
+    if base == resolution:
+        return get_stored_bars(symbol, resolution, from_time, to_time, cache, fetcher)
 
-        if df is None or df.empty:
-            current_app.logger.warning(f"未获取到{symbol}的{resolution}数据")
-            return False
+    # 向前多取一段基础K线，保证起始周期聚合完整
+    margin = 2 * resolution_seconds(resolution) + 3 * 86400
+    bars, upstream_error = get_stored_bars(symbol, base, from_time - margin, to_time, cache, fetcher)
+    session = FUTURES_SESSION if symbol.split(':', 1)[0] in FUTURES_EXCHANGES else STOCK_SESSION
+    return aggregate_bars(bars, resolution, session, from_time, to_time), upstream_error
 
-        # 转换日期为时间戳
-        if '日期' in df.columns:
-            df['timestamp'] = df['日期'].apply(lambda x: int(pd.to_datetime(x).timestamp()))
-        elif '时间' in df.columns:
-            df['timestamp'] = df['时间'].apply(lambda x: int(pd.to_datetime(x).timestamp()))
 
-        # 保存到数据库
-        conn = get_db_connection()
-        cursor = conn.cursor()
+def fill_missing_ranges(conn, symbol, resolution, from_time, to_time, fetcher=None):
+    """向上游补齐 [from_time, to_time] 中尚未获取过的区间（指定 fetcher 时经其限速）
+
+    返回 (fetched, upstream_error)：fetched 为获取到的K线列表（可能尚未落库，读库后需用 merge_bars 合并），
+    upstream_error 为最后一次上游异常（无异常为None）
+    """
+    # 先取待提交的区间再查覆盖记录：其间提交的写入至少出现在两者之一中
+    pending = sorted(PENDING_WRITES.overlapping((symbol, resolution), from_time, to_time), key=lambda e: e[0])
+    fetched = [bars for _, _, bars in pending]
+    upstream_error = None
+    for start, end in subtract_ranges(get_missing_ranges(conn, symbol, resolution, from_time, to_time), pending):
+        try:
+            fetched.append(UPSTREAM_FLIGHT.do((symbol, resolution), start, end,
+                                              lambda: fill_history_range(symbol, resolution, start, end, fetcher)))
+        except Exception as e:
+            current_app.logger.error(f"获取K线数据失败: {symbol} ({resolution}) {start}-{end}: {str(e)}")
+            upstream_error = e
+    return fetched, upstream_error
+
+
+def get_stored_bars(symbol, resolution, from_time, to_time, cache=True, fetcher=None):
+    """读穿缓存：优先从内存缓冲区切片，其次读库，只向上游补齐缺失区间并落库
+
+    返回 (bars, upstream_error)，upstream_error 为补齐过程中最后一次上游异常
+    """
+    now = int(time.time())
+    end = min(to_time, now)
+    key = (symbol, resolution)
+
+    # 内存缓冲区覆盖请求起点：尾部仍新鲜时不访问数据库；略旧时先返回缓冲区数据并在后台补齐尾部，
+    # 超过 HISTORY_MAX_STALE 才在请求线程中补齐
+    # 覆盖判断与切片在同一次加锁内完成，其间缓冲区被淘汰或丢弃时视为未命中
+    cached = BAR_CACHE.read(key, from_time, to_time)
+    if cached is not None:
+        covered_to, bars = cached
+        staleness = end - covered_to
+        if staleness < HISTORY_REFRESH_INTERVAL:
+            return bars, None
+        if staleness < HISTORY_MAX_STALE:
+            BAR_TAIL_REFRESH.submit(key, with_app_context(lambda: extend_buffer_tail(symbol, resolution)))
+            return bars, None
+
+        upstream_error = extend_buffer_tail(symbol, resolution, fetcher)
+        bars = BAR_CACHE.slice(key, from_time, to_time)
+        if bars is not None:
+            return bars, upstream_error
+        # 补齐期间缓冲区被淘汰或丢弃，改为读库
+
+    conn = get_db_connection()
+    try:
+        fetched, upstream_error = fill_missing_ranges(conn, symbol, resolution, from_time, end, fetcher)
+        bars = merge_bars(load_bars(conn, symbol, resolution, from_time, to_time), fetched, from_time, to_time)
+    finally:
+        conn.close()
+
+    # 请求到当前时刻的区间（最近N根K线）装入内存缓冲区
+    if cache and upstream_error is None and now - end < HISTORY_REFRESH_INTERVAL:
+        BAR_CACHE.store(key, bars, from_time, end)
+    return bars, upstream_error
+
 
-        # 映射列名
-        open_col = next((col for col in ['开盘', 'open'] if col in df.columns), None)
-        high_col = next((col for col in ['最高', 'high'] if col in df.columns), None)
-        low_col = next((col for col in ['最低', 'low'] if col in df.columns), None)
-        close_col = next((col for col in ['收盘', 'close'] if col in df.columns), None)
-        volume_col = next((col for col in ['成交量', 'volume'] if col in df.columns), None)
+def extend_buffer_tail(symbol, resolution, fetcher=None):
+    """补齐内存缓冲区之后到当前时刻的K线并追加到缓冲区，返回上游异常（无异常为None）"""
+    key = (symbol, resolution)
+    coverage = BAR_CACHE.coverage(key)
+    if coverage is None:
+        return None
+    _, covered_to, last_time = coverage
+    now = int(time.time())
+
+    conn = get_db_connection()
+    try:
+        fetched, upstream_error = fill_missing_ranges(conn, symbol, resolution, covered_to, now, fetcher)
+        since = last_time if last_time is not None else covered_to
+        tail = merge_bars(load_bars(conn, symbol, resolution, since, now), fetched, since, now)
+    finally:
+        conn.close()
+    BAR_CACHE.extend(key, tail, since, covered_to if upstream_error is not None else now)
+    return upstream_error
+
+
+def get_last_bar(conn, symbol, resolution):
+    """读取已存的最后一根K线（库内没有时取归档的最后一根），无数据时返回None"""
+    row = conn.execute('''
+    SELECT timestamp, open, high, low, close, volume FROM history_bars
+    WHERE series_id = (SELECT series_id FROM history_series WHERE symbol = ? AND resolution = ?)
+    ORDER BY timestamp DESC LIMIT 1
+    ''', (symbol, resolution)).fetchone()
+    if row is not None:
+        return row
+
+    archived = load_archived_month(conn, symbol, resolution, 2 ** 62)
+    if archived is None:
+        return None
+    last = archived.iloc[-1]
+    return (int(last['timestamp']), float(last['open']), float(last['high']), float(last['low']),
+            float(last['close']), int(last['volume']))
+
+
+def select_tail_updates(bars, last_bar):
+    """从上游数据中筛选出比已存最后一根K线更新、或最后一根有变化的K线"""
+    last_ts = last_bar[0]
+    bars = bars[bars['timestamp'] >= last_ts]
+    if not bars.empty and int(bars['timestamp'].iloc[0]) == last_ts:
+        if tuple(bars.iloc[0][BAR_COLUMNS]) == tuple(last_bar):
+            bars = bars.iloc[1:]
+    return bars
+
+
+def sync_history_tail(symbol, resolution, last_bar):
+    """增量同步：只向上游请求最后一根已存K线之后的缺口，等待落库后返回写入条数（供后台线程调用）"""
+    now = int(time.time())
+    bars = select_tail_updates(fetch_upstream_bars(symbol, resolution, last_bar[0], now), last_bar)
+
+    def write(conn):
+        add_covered_range(conn, symbol, resolution, last_bar[0], now)
+        return save_bars(conn, symbol, resolution, bars)
+
+    count = submit_write(write, weight=len(bars)).result()
+    BAR_CACHE.extend((symbol, resolution), bars, last_bar[0], now)
+    return count
+
+
+def sync_history_tails(resolutions=None):
+    """对库中已有的全部 (symbol, resolution) 序列做增量同步（经 HISTORY_FETCHER 限速并发），返回写入总条数"""
+    conn = get_db_connection()
+    try:
+        # SQLite 保证与 MAX() 同行的裸列取自最大时间戳所在行
+        series = conn.execute('''
+        SELECT s.symbol, s.resolution, MAX(b.timestamp), b.open, b.high, b.low, b.close, b.volume
+        FROM history_bars b JOIN history_series s ON s.series_id = b.series_id
+        GROUP BY b.series_id
+        ''').fetchall()
+    finally:
+        conn.close()
+
+    tasks = {}
+    for row in series:
+        symbol, resolution, last_bar = row[0], row[1], tuple(row[2:])
+        if not resolutions or resolution in resolutions:
+            sync = with_app_context(lambda symbol=symbol, resolution=resolution, last_bar=last_bar:
+                                    sync_history_tail(symbol, resolution, last_bar))
+            tasks[(symbol, resolution)] = [('history', sync)]
+
+    start = time.perf_counter()
+    results = HISTORY_FETCHER.run(tasks, timeout=TAIL_SYNC_TIMEOUT, logger=current_app.logger)
+    total = sum(result for result in results.values() if not isinstance(result, Exception))
+    failed = sum(isinstance(result, Exception) for result in results.values())
+    current_app.logger.info(f"增量同步完成: {len(tasks)}个序列（失败{failed}个），写入{total}条，"
+                            f"耗时{time.perf_counter() - start:.1f}秒")
+    return total
+
+
+def fetch_and_save_history_data(symbol, resolution, incremental=False):
+    """从AKShare获取数据并保存到数据库
+
+    incremental=True 且库中已有数据时只获取最后一根K线之后的数据
+    """
+    try:
+        resolution = normalize_resolution(resolution)
+        if resolution is None:
+            return False
+        resolution = resolution_base(resolution)
 
-        if not all([open_col, high_col, low_col, close_col]):
-            current_app.logger.error(f"数据列不完整，无法保存{symbol}的{resolution}数据")
+        conn = get_db_connection()
+        try:
+            last_bar = get_last_bar(conn, symbol, resolution) if incremental else None
+        finally:
             conn.close()
+        if last_bar is not None:
+            count = sync_history_tail(symbol, resolution, tuple(last_bar))
+            current_app.logger.info(f"已增量更新{count}条{symbol}的{resolution}数据")
+            return True
+
+        bars = fetch_upstream_bars(symbol, resolution)
+        if bars.empty:
+            current_app.logger.warning(f"未获取到{symbol}的{resolution}数据")
             return False
 
-        # 批量插入
-        rows = []
-        for _, row in df.iterrows():
-            rows.append((
-                symbol,
-                resolution,
-                row['timestamp'],
-                row[open_col],
-                row[high_col],
-                row[low_col],
-                row[close_col],
-                row[volume_col] if volume_col else 0
-            ))
-
-        cursor.executemany('''
-        INSERT OR REPLACE INTO history_data 
-        (symbol, resolution, timestamp, open, high, low, close, volume)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', rows)
-
-        conn.commit()
-        conn.close()
-        current_app.logger.info(f"已保存{len(rows)}条{symbol}的{resolution}数据到数据库")
+        def write(conn):
+            add_covered_range(conn, symbol, resolution, int(bars['timestamp'].iloc[0]), int(time.time()))
+            return save_bars(conn, symbol, resolution, bars)
+
+        count = submit_write(write, weight=len(bars)).result()
+        BAR_CACHE.discard((symbol, resolution))
+
+        current_app.logger.info(f"已保存{count}条{symbol}的{resolution}数据到数据库")
         return True
 
     except Exception as e:
         current_app.logger.error(f"保存历史数据失败: {str(e)}", exc_info=True)
         return False
 
+
+def refresh_history_tail(symbol, resolution, min_interval=0):
+    """向上游同步序列尾部，返回写入条数
+
+    库中尚无该序列时跳过（由读穿缓存首次补齐）；min_interval 秒内已同步过（如由其他工作进程）时也跳过
+    """
+    conn = get_db_connection()
+    try:
+        last_bar = get_last_bar(conn, symbol, resolution)
+        covered_to = conn.execute("SELECT MAX(range_end) FROM history_coverage WHERE symbol = ? AND resolution = ?",
+                                  (symbol, resolution)).fetchone()[0]
+    finally:
+        conn.close()
+    if last_bar is None or (covered_to is not None and time.time() - covered_to < min_interval):
+        return 0
+    return sync_history_tail(symbol, resolution, tuple(last_bar))
+
+
+def get_latest_bars(symbol, resolution, count=2):
+    """读取最近 count 根K线（派生周期由基础周期聚合），向前多看一段以跨过节假日"""
+    now = int(time.time())
+    lookback = 10 * resolution_seconds(resolution) + 3 * 86400
+    bars, _ = get_history_bars(symbol, resolution, now - lookback, now, countback=count)
+    return bars
+
+
+def bar_record(bar):
+    """标准列K线 -> TradingView Bar 结构（毫秒时间戳）"""
+    timestamp, open_, high, low, close, volume = bar
+    return {"time": int(timestamp) * 1000, "open": open_, "high": high, "low": low,
+            "close": close, "volume": volume}
+
+
+class BarStream:
+    """实时K线推送
+
+    每个符号一个后台轮询线程：同一基础周期只向上游同步一次（经 STREAM_FETCHER 限速），再为各订阅周期计算
+    最后一根K线，只有变化时才分发到订阅者队列。一个连接的多个订阅共用一个队列，
+    消息为 (符号, 周期, K线)；订阅者消费过慢时丢弃较早的消息
+    """
+
+    def __init__(self, poll_interval, queue_size):
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._symbols = {}  # symbol -> {resolution: {'subscribers': set(队列), 'last': 最后一根K线}}
+
+    def subscribe(self, app, symbol, resolution, subscriber=None):
+        """订阅 (symbol, resolution)，返回消息队列（subscriber 为连接已有的队列时共用）；当前已有最后一根K线时立即放入"""
+        if subscriber is None:
+            subscriber = queue.Queue(self.queue_size)
+        with self._lock:
+            channels = self._symbols.get(symbol)
+            start_poller = channels is None
+            if start_poller:
+                channels = self._symbols[symbol] = {}
+            channel = channels.setdefault(resolution, {'subscribers': set(), 'last': None})
+            channel['subscribers'].add(subscriber)
+            if channel['last'] is not None:
+                self._put(subscriber, (symbol, resolution, [bar_record(channel['last'])]))
+
+        if start_poller:
+            threading.Thread(target=self._poll, args=(app, symbol, channels), daemon=True).start()
+        return subscriber
+
+    def unsubscribe(self, symbol, resolution, subscriber):
+        with self._lock:
+            channels = self._symbols.get(symbol, {})
+            channel = channels.get(resolution)
+            if channel is None:
+                return
+            channel['subscribers'].discard(subscriber)
+            if not channel['subscribers']:
+                del channels[resolution]
+            if not channels:
+                self._symbols.pop(symbol, None)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(channel['subscribers']) for channels in self._symbols.values()
+                       for channel in channels.values())
+
+    def publish(self, symbol, resolution, bars):
+        """最后一根K线变化时分发；新开一根K线时先补发上一根的最终值"""
+        if bars.empty:
+            return
+        rows = list(bars[BAR_COLUMNS].itertuples(index=False, name=None))
+        last = rows[-1]
+        with self._lock:
+            channel = self._symbols.get(symbol, {}).get(resolution)
+            if channel is None or channel['last'] == last:
+                return
+            previous = channel['last']
+            if previous is not None and last[0] < previous[0]:
+                return
+            message = [bar_record(last)]
+            if previous is not None and last[0] > previous[0] and len(rows) >= 2:
+                message.insert(0, bar_record(rows[-2]))
+            channel['last'] = last
+
+            for subscriber in channel['subscribers']:
+                self._put(subscriber, (symbol, resolution, message))
+
+    @staticmethod
+    def _put(subscriber, message):
+        try:
+            subscriber.put_nowait(message)
+        except queue.Full:
+            # 慢消费者只需要最新的K线
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                pass
+            subscriber.put_nowait(message)
+
+    def _poll(self, app, symbol, channels):
+        """单个符号的轮询线程，没有订阅者（或已被新线程取代）时退出"""
+        with app.app_context():
+            while True:
+                with self._lock:
+                    if self._symbols.get(symbol) is not channels or not channels:
+                        return
+                    resolutions = list(channels)
+
+                for base in {resolution_base(resolution) for resolution in resolutions}:
+                    try:
+                        STREAM_FETCHER.call('history', lambda: refresh_history_tail(symbol, base, self.poll_interval),
+                                            current_app.logger)
+                    except Exception as e:
+                        current_app.logger.warning(f"推送轮询同步{symbol}的{base}数据失败: {e}")
+
+                for resolution in resolutions:
+                    try:
+                        self.publish(symbol, resolution, get_latest_bars(symbol, resolution))
+                    except Exception as e:
+                        current_app.logger.warning(f"推送轮询读取{symbol}的{resolution}数据失败: {e}")
+
+                time.sleep(self.poll_interval)
+
+
+# 推送轮询间隔（秒）、每个订阅的队列长度与SSE心跳间隔（秒，用于及时发现断开的连接）
+STREAM_POLL_INTERVAL = 10
+STREAM_QUEUE_SIZE = 16
+STREAM_HEARTBEAT = 15
+STREAM_MAX_SUBSCRIPTIONS = 100  # 单个连接最多订阅的 (符号, 周期) 数
+# 推送轮询的上游请求（新浪分钟线）全部轮询线程共用一个令牌桶（每秒请求数, 突发上限），订阅再多也不会被封IP
+STREAM_RATE_LIMIT = (1, 2)
+STREAM_FETCHER = FetchScheduler(max_workers=1, rate_limits={'history': STREAM_RATE_LIMIT}, max_attempts=1)
+
+BAR_STREAM = BarStream(STREAM_POLL_INTERVAL, STREAM_QUEUE_SIZE)
+
+
 @udf_bp.route('/time')
 @error_handler
 def get_server_time():
@@ -228,9 +1426,9 @@ def get_server_time():
 @error_handler
 def config():
     """提供TradingView所需的配置信息"""
-    return jsonify({
+    return cached_json_response(('config',), lambda: {
         "supports_search": True,
-        "supports_group_request": False,
+        "supports_group_request": True,
         "supports_marks": False,
         "supports_timescale_marks": False,
         "supports_time": True,
@@ -251,13 +1449,33 @@ def config():
             {"name": "股票", "value": "stock"},
             {"name": "期货", "value": "future"}
         ],
-        "supported_resolutions": [
-            "1", "5", "15", "30", "60",
-            "D", "1D", "W", "M"
-        ]
+        "supported_resolutions": SUPPORTED_RESOLUTIONS
     })
 
 
+def rebuild_search_index(stocks, futures):
+    """用最新的符号列表重建搜索索引（构建完成后整体替换，查询无需加锁）"""
+    global SEARCH_INDEX
+    start = time.perf_counter()
+    SEARCH_INDEX = SymbolIndex(stocks, futures)
+    current_app.logger.info(f"搜索索引已重建: {len(SEARCH_INDEX)}个符号，{time.perf_counter() - start:.2f}秒")
+    return SEARCH_INDEX
+
+
+def get_search_index():
+    """获取搜索索引，尚未构建时从数据库加载"""
+    if SEARCH_INDEX is not None:
+        return SEARCH_INDEX
+
+    conn = get_db_connection()
+    try:
+        stocks = [tuple(row) for row in conn.execute("SELECT code, name, exchange FROM stocks")]
+        futures = [tuple(row) for row in conn.execute("SELECT code, name, exchange FROM futures")]
+    finally:
+        conn.close()
+    return rebuild_search_index(stocks, futures)
+
+
 @udf_bp.route('/search')
 @error_handler
 def search():
@@ -277,62 +1495,21 @@ def search():
             # 转换失败时使用默认值
             limit = 30
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # 构建查询条件
-        conditions = []
-        params = []
-
-        if query:
-            conditions.append("(code LIKE ? OR name LIKE ?)")
-            params.append(f'%{query}%')
-            params.append(f'%{query}%')
-
-        if exchange:
-            conditions.append("exchange = ?")
-            params.append(exchange)
-
-        results = []
-
-        # 查询股票
-        stock_sql = "SELECT code, name, exchange, 'stock' as type FROM stocks"
-        if conditions:
-            stock_sql += " WHERE " + " AND ".join(conditions)
-        stock_sql += " LIMIT ?"
-        stock_params = params.copy()
-        stock_params.append(limit)
-
-        cursor.execute(stock_sql, stock_params)
-        stocks = cursor.fetchall()
-
-        # 查询期货
-        future_sql = "SELECT code, name, exchange, 'future' as type FROM futures"
-        if conditions:
-            future_sql += " WHERE " + " AND ".join(conditions)
-        future_sql += " LIMIT ?"
-        future_params = params.copy()
-        future_params.append(limit)
-
-        cursor.execute(future_sql, future_params)
-        futures = cursor.fetchall()
-
-        conn.close()
+        # 在内存索引中查找（精确 > 前缀 > 子串）
+        matches = get_search_index().search(query, exchange, symbol_type, limit)
 
         # 格式化结果为TradingView所需格式
-        for item in stocks + futures:
+        results = []
+        for code, name, item_exchange, item_type in matches:
             results.append({
-                "symbol": f"{item['exchange']}:{item['code']}",
-                "full_name": f"{item['exchange']}:{item['code']}",
-                "description": item['name'],
-                "exchange": item['exchange'],
-                "type": item['type'],
+                "symbol": f"{item_exchange}:{code}",
+                "full_name": f"{item_exchange}:{code}",
+                "description": name,
+                "exchange": item_exchange,
+                "type": item_type,
                 "tick_size": 0.01
             })
 
-        # 限制总结果数量
-        results = results[:limit]
-
         return jsonify(results)
 
     except Exception as e:
@@ -341,79 +1518,101 @@ def search():
         return jsonify([])
 
 
-@udf_bp.route('/symbols')
-@error_handler
-def symbols():
-    """获取单个符号的详细信息"""
+# 落库的分钟级基础周期，其余分钟周期由数据馈送在客户端或服务端聚合
+INTRADAY_MULTIPLIERS = [str(base) for base in sorted(INTRADAY_BASES)]
+
+
+def symbol_session(symbol_type):
+    """品种类型（stock/future，与 /search 一致）对应的交易时段"""
+    return FUTURES_SESSION if symbol_type == 'future' else STOCK_SESSION
+
+
+def symbol_trading_fields(symbol_type):
+    """/symbols 与 /symbol_info 共用的品种字段（UDF 字段名，单符号与分组模式的数据馈送都识别）"""
+    return {
+        "type": symbol_type,
+        "session-regular": symbol_session(symbol_type),
+        "timezone": MARKET_TZ,
+        "minmovement": 1,
+        "pricescale": 100,
+        "fractional": False,
+        "has-intraday": True,
+        "has-daily": True,
+        "intraday-multipliers": INTRADAY_MULTIPLIERS,
+        "visible-plots-set": "ohlcv",
+        "supported-resolutions": SUPPORTED_RESOLUTIONS,
+    }
+
+
+def build_symbol_info(symbol):
+    """查询单个符号的详细信息，返回 /symbols 响应结构"""
+    # 基础响应结构 - 确保所有必要字段都存在
+    response = {
+        "name": symbol,
+        "ticker": symbol,  # 关键字段：添加ticker属性
+        "exchange-traded": "",
+        "exchange-listed": "",
+        "description": "",
+        **symbol_trading_fields('stock'),
+    }
+
+    if not symbol:
+        response["description"] = "缺少符号参数"
+        return response
+
+    # 解析符号格式：交易所:代码
     try:
-        symbol = request.args.get('symbol', '')
-        current_app.logger.debug(f"获取符号信息: {symbol}")
-
-        # 基础响应结构 - 确保所有必要字段都存在
-        response = {
-            "name": symbol,
-            "ticker": symbol,  # 关键字段：添加ticker属性
-            "exchange-traded": "",
-            "exchange-listed": "",
-            "timezone": "Asia/Shanghai",
-            "minmov": 1,
-            "pricescale": 100,
-            "session": "0930-1130,1300-1500",
-            "has_intraday": True,
-            "visible_plots_set": True,
-            "description": "",
-            "type": "stock",
-            "supported_resolutions": ["1", "5", "15", "30", "60", "D", "1D", "W", "M"]
-        }
-
-        if not symbol:
-            response["description"] = "缺少符号参数"
-            return jsonify(response)
-
-        # 解析符号格式：交易所:代码
-        try:
-            exchange, code = symbol.split(':', 1)
-            response["exchange-traded"] = exchange
-            response["exchange-listed"] = exchange
-            response["ticker"] = f"{exchange}:{code}"  # 设置ticker为代码部分
-            response["name"] = f"{code} ({exchange})"
-        except ValueError:
-            current_app.logger.error(f"无效的符号格式: {symbol}")
-            response["description"] = f"无效的符号格式: {symbol}"
-            return jsonify(response)
+        exchange, code = symbol.split(':', 1)
+        response["exchange-traded"] = exchange
+        response["exchange-listed"] = exchange
+        response["ticker"] = f"{exchange}:{code}"  # 设置ticker为代码部分
+        response["name"] = f"{code} ({exchange})"
+    except ValueError:
+        current_app.logger.error(f"无效的符号格式: {symbol}")
+        response["description"] = f"无效的符号格式: {symbol}"
+        return response
+
+    # 查询数据库获取名称
+    conn = get_db_connection()
+    cursor = conn.cursor()
 
+    # 先查股票
+    cursor.execute("SELECT name FROM stocks WHERE code = ? AND exchange = ?", (code, exchange))
+    stock = cursor.fetchone()
 
-        # 查询数据库获取名称
-        conn = get_db_connection()
-        cursor = conn.cursor()
+    if stock:
+        response["description"] = stock['name']
+        response["name"] = f"{code} {stock['name']}"
+        conn.close()
+        return response
 
-        # 先查股票
-        cursor.execute("SELECT name FROM stocks WHERE code = ? AND exchange = ?", (code, exchange))
-        stock = cursor.fetchone()
+    # 再查期货
+    cursor.execute("SELECT name FROM futures WHERE code = ? AND exchange = ?", (code, exchange))
+    future = cursor.fetchone()
 
-        if stock:
-            response["description"] = stock['name']
-            response["name"] = f"{code} {stock['name']}"
-            conn.close()
-            return jsonify(response)
+    if future:
+        response["description"] = future['name']
+        response["name"] = f"{code} {future['name']}"
+        response.update(symbol_trading_fields('future'))
+        conn.close()
+        return response
 
-        # 再查期货
-        cursor.execute("SELECT name FROM futures WHERE code = ? AND exchange = ?", (code, exchange))
-        future = cursor.fetchone()
+    conn.close()
+    current_app.logger.warning(f"未找到符号信息: {symbol}，返回默认结构")
 
-        if future:
-            response["description"] = future['name']
-            response["name"] = f"{code} {future['name']}"
-            response["type"] = "futures"
-            response["session"] = "0900-1015,1030-1130,1330-1500,2100-2300"
-            conn.close()
-            return jsonify(response)
+    # 即使找不到，也返回完整结构
+    return response
 
-        conn.close()
-        current_app.logger.warning(f"未找到符号信息: {symbol}，返回默认结构")
 
-        # 即使找不到，也返回完整结构
-        return jsonify(response)
+@udf_bp.route('/symbols')
+@error_handler
+def symbols():
+    """获取单个符号的详细信息"""
+    try:
+        symbol = request.args.get('symbol', '')
+        current_app.logger.debug(f"获取符号信息: {symbol}")
+        loader = with_app_context(lambda: build_symbol_info(symbol))
+        return cached_json_response(('symbols', symbol), lambda: SYMBOL_INFO.get(symbol, loader))
 
     except Exception as e:
         current_app.logger.error(f"符号信息接口错误: {str(e)}")
@@ -435,6 +1634,65 @@ def symbols():
         })
 
 
+def build_group_symbol_info(group):
+    """按交易所分组查询全部符号，返回UDF列式 symbol_info 结构（group为空时返回全部）"""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute('''
+        SELECT code, name, exchange, 'stock' FROM stocks WHERE ? = '' OR exchange = ?
+        UNION ALL
+        SELECT code, name, exchange, 'future' FROM futures WHERE ? = '' OR exchange = ?
+        ORDER BY 1
+        ''', (group, group, group, group)).fetchall()
+    finally:
+        conn.close()
+
+    codes = [row[0] for row in rows]
+    exchanges = [row[2] for row in rows]
+    types = [row[3] for row in rows]
+
+    # 各符号相同的字段直接给标量，数据馈送会按列展开；字段与 /symbols 相同
+    info = {
+        "symbol": codes,
+        "ticker": [f"{exchange}:{code}" for code, exchange in zip(codes, exchanges)],
+        "description": [row[1] or code for row, code in zip(rows, codes)],
+        "exchange-listed": exchanges,
+        "exchange-traded": exchanges,
+        **symbol_trading_fields('stock'),
+    }
+    info["type"] = types
+    info["session-regular"] = [symbol_session(t) for t in types]
+    return info
+
+
+@udf_bp.route('/symbol_info')
+@error_handler
+def symbol_info():
+    """分组获取符号信息（supports_group_request），一次请求返回整个交易所的符号"""
+    group = request.args.get('group', '')
+    return cached_json_response(('symbol_info', group), lambda: build_group_symbol_info(group))
+
+
+def history_response(bars):
+    """将K线编码为UDF历史数据JSON响应，客户端支持时压缩"""
+    body, encoding = compress_body(encode_history_json(bars), request.accept_encodings)
+    response = current_app.response_class(body, mimetype='application/json')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def binary_history_response(bars, price_type):
+    """将K线编码为二进制列式响应，各列直接以数组内存写出"""
+    chunks, length = encode_history_binary(bars, price_type)
+    # WSGI 只接受 bytes：逐列在写出时转换，不拼接成整块
+    response = current_app.response_class((bytes(chunk) for chunk in chunks), mimetype=BINARY_MIMETYPE)
+    response.headers['Content-Length'] = str(length)
+    response.vary.add('Accept')
+    return response
+
+
 @udf_bp.route('/history')
 @error_handler
 def history():
@@ -461,441 +1719,1371 @@ def history():
 
         # 解析符号（交易所:代码）
         try:
-            exchange, code = symbol.split(':', 1)
-            current_app.logger.debug(f"解析符号: 交易所={exchange}, 代码={code}")
+            exchange, code, adjusted_code = parse_symbol(symbol)
+            current_app.logger.debug(f"解析符号: 交易所={exchange}, 代码={code}, 转换后代码={adjusted_code}")
         except ValueError:
             current_app.logger.error(f"无效的符号格式: {symbol}")
             return jsonify({"s": "error", "errmsg": f"无效的符号格式: {symbol}"})
 
-        # 转换股票代码格式（AKShare需要特定前缀）
-        # 上海证券交易所: sh+代码，深圳: sz+代码
-        adjusted_code = code
-        if exchange == "SSE":
-            adjusted_code = f"sh{code}"  # 上海股票代码前缀
-        elif exchange == "SZSE":
-            adjusted_code = f"sz{code}"  # 深圳股票代码前缀
-        current_app.logger.debug(f"转换后代码: {adjusted_code}")
-
-        # 转换分辨率为AKShare支持的格式
-        period_map = {
-            "1": "1",  # 1分钟
-            "5": "5",  # 5分钟
-            "15": "15",  # 15分钟
-            "30": "30",  # 30分钟
-            "60": "60",  # 60分钟
-            "D": "daily",  # 日线
-            "1D": "daily",  # 日线
-            "W": "weekly",  # 周线
-            "M": "monthly"  # 月线
-        }
-
-        if resolution not in period_map:
+        # 归一化周期
+        period = normalize_resolution(resolution)
+        if period is None:
             current_app.logger.error(f"不支持的时间周期: {resolution}")
             return jsonify({"s": "error", "errmsg": f"不支持的周期: {resolution}"})
+        record_access(symbol, period)
+
+        # 校验时间戳有效性（Python可处理的时间范围约为1970-2100年）
+        if from_time < 0 or from_time > 4102444800:  # 4102444800是2100年的时间戳
+            from_time = int(time.time()) - 30 * 86400  # 默认为30天前
+
+        if to_time < 0 or to_time > 4102444800:
+            to_time = int(time.time())  # 默认为当前时间
+        current_app.logger.debug(f"查询时间范围: {from_time} 至 {to_time}")
+
+        # TradingView 要求的K线根数（优先于 from）
+        countback = request.args.get('countback', type=int)
+
+        # 获取K线数据（优先读本地库，只向上游补齐缺失区间）
+        df, upstream_error = get_history_bars(symbol, period, from_time, to_time, countback)
+
+        if df.empty:
+            if upstream_error is not None:
+                # 尝试返回测试数据帮助调试
+                return jsonify({
+                    "s": "ok",
+                    "t": [from_time + 86400 * i for i in range(5)],  # 5天的时间戳
+                    "o": [10.0, 10.2, 10.1, 10.3, 10.5],  # 开盘价
+                    "h": [10.1, 10.3, 10.2, 10.4, 10.6],  # 最高价
+                    "l": [9.9, 10.1, 10.0, 10.2, 10.4],  # 最低价
+                    "c": [10.0, 10.2, 10.1, 10.3, 10.5],  # 收盘价
+                    "v": [1000, 2000, 1500, 2500, 3000]  # 成交量
+                })
+            current_app.logger.warning(f"未获取到数据: {symbol} ({resolution})")
+            response = {"s": "no_data"}
+            next_time = get_next_time(symbol, period, from_time)
+            if next_time is not None:
+                response["nextTime"] = next_time
+            return jsonify(response)
 
-        ak_period = period_map[resolution]
-        current_app.logger.debug(f"时间周期转换: {resolution} -> {ak_period}")
+        current_app.logger.debug(f"获取数据成功: {len(df)} 条记录")
 
-        # 转换时间格式为AKShare需要的字符串（YYYYMMDD）
-        try:
-            # 校验时间戳有效性（Python可处理的时间范围约为1970-2100年）
-            if from_time < 0 or from_time > 4102444800:  # 4102444800是2100年的时间戳
-                from_time = int(time.time()) - 30 * 86400  # 默认为30天前
-
-            if to_time < 0 or to_time > 4102444800:
-                to_time = int(time.time())  # 默认为当前时间
-
-            from_date = datetime.fromtimestamp(from_time).strftime('%Y%m%d')
-            to_date = datetime.fromtimestamp(to_time).strftime('%Y%m%d')
-            current_app.logger.debug(f"查询时间范围: {from_date} 至 {to_date}")
-        except OSError as e:
-            current_app.logger.error(f"时间戳转换失败: {e}")
-            # 提供默认时间范围（最近30天）
-            from_date = (datetime.now() - timedelta(days=30)).strftime('%Y%m%d')
-            to_date = datetime.now().strftime('%Y%m%d')
-            current_app.logger.debug(f"使用默认时间范围: {from_date} 至 {to_date}")
-
-        # 获取K线数据
-        df = None
-        try:
-            if exchange in ['SSE', 'SZSE', 'BSE']:  # 股票
-                if ak_period == "daily":
-                    df = ak.stock_zh_a_daily(symbol=adjusted_code, start_date=from_date, end_date=to_date)
-                elif ak_period == "weekly":
-                    df = ak.stock_zh_a_weekly(symbol=adjusted_code, start_date=from_date, end_date=to_date)
-                elif ak_period == "monthly":
-                    df = ak.stock_zh_a_monthly(symbol=adjusted_code, start_date=from_date, end_date=to_date)
-                else:  # 分钟线
-                    df = ak.stock_zh_a_minute(symbol=adjusted_code, period=ak_period)
-
-            elif exchange in ['CFFEX', 'SHFE', 'DCE', 'CZCE']:  # 期货
-                df = ak.futures_zh_daily(symbol=code, start_date=from_date, end_date=to_date)
-
-            # 检查数据是否为空
-            if df is None or df.empty:
-                current_app.logger.warning(f"未获取到数据: {symbol} ({resolution})")
-                return jsonify({"s": "no_data"})
-
-            current_app.logger.debug(f"获取数据成功: {len(df)} 条记录")
+        # 内部使用方可通过 Accept 协商二进制格式，price=float32 时价格列使用单精度
+        if request.accept_mimetypes.best_match(['application/json', BINARY_MIMETYPE]) == BINARY_MIMETYPE:
+            price_type = request.args.get('price', 'float64')
+            return binary_history_response(df, price_type if price_type in PRICE_DTYPES else 'float64')
 
-        except Exception as e:
-            current_app.logger.error(f"获取K线数据失败: {str(e)}", exc_info=True)
-            # 尝试返回测试数据帮助调试
-            return jsonify({
-                "s": "ok",
-                "t": [from_time + 86400 * i for i in range(5)],  # 5天的时间戳
-                "o": [10.0, 10.2, 10.1, 10.3, 10.5],  # 开盘价
-                "h": [10.1, 10.3, 10.2, 10.4, 10.6],  # 最高价
-                "l": [9.9, 10.1, 10.0, 10.2, 10.4],  # 最低价
-                "c": [10.0, 10.2, 10.1, 10.3, 10.5],  # 收盘价
-                "v": [1000, 2000, 1500, 2500, 3000]  # 成交量
-            })
+        # 格式化数据为TradingView要求的格式（直接从numpy列编码）
+        return history_response(df)
 
-        # 格式化数据为TradingView要求的格式
-        try:
-            # 确保日期列存在并转换为时间戳（秒级）
-            # 优先处理分钟线特有的 `day` 列（AKShare 分钟线数据的时间列名）
-            if 'day' in df.columns:
-                df['timestamp'] = df['day'].apply(
-                    lambda x: int(pd.to_datetime(x).timestamp())
-                )
-            elif '日期' in df.columns:
-                df['timestamp'] = df['日期'].apply(
-                    lambda x: int(pd.to_datetime(x).timestamp())
-                )
-            elif '时间' in df.columns:
-                df['timestamp'] = df['时间'].apply(
-                    lambda x: int(pd.to_datetime(x).timestamp())
-                )
-            else:
-                # 尝试自动识别日期列（包含 day、date、time 等关键词）
-                date_cols = [col for col in df.columns if
-                             'date' in col.lower() or
-                             'time' in col.lower() or
-                             'day' in col.lower()]  # 新增对 day 的识别
-                if date_cols:
-                    df['timestamp'] = df[date_cols[0]].apply(
-                        lambda x: int(pd.to_datetime(x).timestamp())
-                    )
-                else:
-                    current_app.logger.error("未找到日期列（day/日期/时间），无法转换时间戳")
-                    return jsonify({"s": "error", "errmsg": "数据格式错误（缺少时间列）"})
-
-            # 映射价格和成交量列（处理不同数据源的列名差异）
-            price_cols = {
-                'o': ['开盘', 'open', '开盘价'],
-                'h': ['最高', 'high', '最高价'],
-                'l': ['最低', 'low', '最低价'],
-                'c': ['收盘', 'close', '收盘价'],
-                'v': ['成交量', 'volume', '成交']
-            }
-
-            result = {"s": "ok"}
-            for key, possible_cols in price_cols.items():
-                # 找到第一个存在的列名
-                found_col = next((col for col in possible_cols if col in df.columns), None)
-                if found_col:
-                    # 转换为数值类型
-                    df[found_col] = pd.to_numeric(df[found_col], errors='coerce')
-                    result[key] = df[found_col].fillna(0).tolist()
-                else:
-                    current_app.logger.warning(f"未找到{key}对应的列，使用默认值")
-                    result[key] = [0] * len(df)
+    except Exception as e:
+        current_app.logger.error(f"历史数据接口异常: {str(e)}", exc_info=True)
+        return jsonify({"s": "error", "errmsg": "服务器内部错误"})
 
-            # 添加时间戳列
-            result['t'] = df['timestamp'].tolist()
 
-            return jsonify(result)
+# 批量历史数据：并发补齐的线程数、同时在途的符号数（限制服务端内存）与单次请求的符号上限
+BULK_WORKERS = 8
+BULK_WINDOW = 16
+BULK_MAX_SYMBOLS = 10000
+# 批量请求中需要回源的符号全部共用一个令牌桶（每秒请求数, 突发上限），已落库的符号不受限
+BULK_RATE_LIMIT = (2, 4)
+BULK_FETCHER = FetchScheduler(max_workers=BULK_WORKERS, rate_limits={'history': BULK_RATE_LIMIT}, max_attempts=1)
 
-        except Exception as e:
-            current_app.logger.error(f"格式化K线数据失败: {str(e)}", exc_info=True)
-            return jsonify({"s": "error", "errmsg": "数据格式化失败"})
 
-    except Exception as e:
-        current_app.logger.error(f"历史数据接口异常: {str(e)}", exc_info=True)
-        return jsonify({"s": "error", "errmsg": "服务器内部错误"})
+@udf_bp.route('/history_bulk', methods=['GET', 'POST'])
+@error_handler
+def history_bulk():
+    """批量获取多个符号的K线：有界线程池并发补齐（回源经 BULK_FETCHER 限速），按请求顺序逐个符号流式返回
+
+    参数可用JSON请求体（symbols 为列表）或查询字符串（symbols 以逗号分隔）传入；
+    默认返回NDJSON（每行一个符号），Accept 为二进制格式时返回二进制帧
+    """
+    params = request.get_json(silent=True) or request.args
+    symbols = params.get('symbols', [])
+    if isinstance(symbols, str):
+        symbols = [symbol for symbol in symbols.split(',') if symbol]
+    resolution = normalize_resolution(str(params.get('resolution', '')))
+    try:
+        from_time = int(params.get('from', 0))
+        to_time = int(params.get('to', time.time()))
+        countback = int(params.get('countback') or 0) or None
+    except (TypeError, ValueError):
+        return jsonify({"s": "error", "errmsg": "参数错误"}), 400
+    if resolution is None or not symbols or len(symbols) > BULK_MAX_SYMBOLS:
+        return jsonify({"s": "error", "errmsg": f"需要1-{BULK_MAX_SYMBOLS}个符号和有效的周期"}), 400
+
+    binary = request.accept_mimetypes.best_match(['application/x-ndjson', BINARY_MIMETYPE]) == BINARY_MIMETYPE
+    price_type = params.get('price', 'float64')
+    price_type = price_type if price_type in PRICE_DTYPES else 'float64'
+    app = current_app._get_current_object()
+    dumps = current_app.json.dumps
+    current_app.logger.info(f"批量历史数据请求: {len(symbols)}个符号 ({resolution})")
+
+    def load(symbol):
+        # 批量拉取不装入内存缓冲区，避免挤出交互请求的热点序列
+        with app.app_context():
+            try:
+                bars, upstream_error = get_history_bars(symbol, resolution, from_time, to_time, countback,
+                                                        cache=False, fetcher=BULK_FETCHER)
+            except Exception as e:
+                app.logger.warning(f"批量获取{symbol}的K线失败: {e}")
+                return symbol, None, e
+            return symbol, bars, upstream_error if bars.empty else None
+
+    def encode(symbol, bars, error):
+        if error is not None:
+            status = 'error'
+        else:
+            status = 'ok' if not bars.empty else 'no_data'
+        if binary:
+            empty = pd.DataFrame(columns=BAR_COLUMNS)
+            return [bytes(chunk) for chunk in
+                    encode_bulk_frame(symbol, status, bars if status == 'ok' else empty, price_type)]
+        if status == 'ok':
+            return [encode_history_json(bars, symbol) + b'\n']
+        line = {"symbol": symbol, "s": status}
+        if error is not None:
+            line["errmsg"] = str(error)
+        return [dumps(line).encode('utf-8') + b'\n']
+
+    def generate():
+        # 按请求顺序滑动窗口提交，最多 BULK_WINDOW 个符号的数据同时驻留内存
+        pool = ThreadPoolExecutor(BULK_WORKERS)
+        try:
+            remaining = iter(symbols)
+            pending = deque(pool.submit(load, symbol) for symbol in islice(remaining, BULK_WINDOW))
+            while pending:
+                result = pending.popleft().result()
+                for symbol in islice(remaining, 1):
+                    pending.append(pool.submit(load, symbol))
+                yield from encode(*result)
+        finally:
+            # 客户端断开时取消尚未开始的符号
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    mimetype = BINARY_MIMETYPE if binary else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype, headers={'X-Accel-Buffering': 'no'})
+
+
+@udf_bp.route('/stream')
+def stream():
+    """SSE推送实时K线：一个连接订阅多个符号与周期（symbols 与 resolutions 逗号分隔、一一对应），
+
+    每条消息为 {"symbol", "resolution", "bars"}，bars 为变化的K线数组（新开一根时包含上一根的最终值）
+    """
+    symbols = request.args.get('symbols', '').split(',')
+    resolutions = request.args.get('resolutions', '').split(',')
+    if len(symbols) != len(resolutions) or len(symbols) > STREAM_MAX_SUBSCRIPTIONS:
+        return jsonify({"s": "error", "errmsg": "参数错误"}), 400
+
+    # (符号, 标准周期) -> 客户端请求的周期写法（消息中原样返回，供客户端对应订阅）
+    channels = {}
+    for symbol, requested in zip(symbols, resolutions):
+        resolution = normalize_resolution(requested)
+        if ':' not in symbol or resolution is None:
+            return jsonify({"s": "error", "errmsg": f"参数错误: {symbol} ({requested})"}), 400
+        channels.setdefault((symbol, resolution), []).append(requested)
+
+    dumps = current_app.json.dumps
+    app = current_app._get_current_object()
+    subscriber = queue.Queue(STREAM_QUEUE_SIZE * len(channels))
+    for symbol, resolution in channels:
+        BAR_STREAM.subscribe(app, symbol, resolution, subscriber)
+    current_app.logger.debug(f"推送订阅: {len(channels)}个序列，当前订阅数 {BAR_STREAM.subscriber_count()}")
+
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    symbol, resolution, bars = subscriber.get(timeout=STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                for requested in channels[(symbol, resolution)]:
+                    yield f"data: {dumps({'symbol': symbol, 'resolution': requested, 'bars': bars})}\n\n"
+        finally:
+            # 客户端断开后生成器被关闭，在此退订
+            for symbol, resolution in channels:
+                BAR_STREAM.unsubscribe(symbol, resolution, subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def load_symbol_lists():
+    """从数据库加载股票和期货列表，返回 ([(代码, 名称, 交易所)], [...])"""
+    conn = get_db_connection()
+    try:
+        stocks = [tuple(row) for row in conn.execute("SELECT code, name, exchange FROM stocks ORDER BY code")]
+        futures = [tuple(row) for row in conn.execute("SELECT code, name, exchange FROM futures ORDER BY code")]
+    finally:
+        conn.close()
+    return stocks, futures
+
+
+def get_symbol_lists():
+    """获取股票和期货列表（过期后先返回旧列表，后台重新加载）"""
+    return SYMBOL_LISTS.get('all', load_symbol_lists)
 
 
 @udf_bp.route('/symbols_list')
 @error_handler
 def symbols_list():
     """获取所有符号列表"""
-    global STOCK_LIST_CACHE, FUTURES_LIST_CACHE, LAST_CACHE_UPDATE, CACHE_EXPIRY
 
-    # 检查缓存是否过期
-    current_time = time.time()
-    if current_time - LAST_CACHE_UPDATE < CACHE_EXPIRY and STOCK_LIST_CACHE and FUTURES_LIST_CACHE:
+    # 格式化返回（编码结果缓存到下次列表更新）
+    def build():
+        stock_list, futures_list = get_symbol_lists()
         stocks = [{"code": code, "name": name, "exchange": exchange, "type": "stock"}
-                  for code, name, exchange in STOCK_LIST_CACHE]
+                  for code, name, exchange in stock_list]
         futures = [{"code": code, "name": name, "exchange": exchange, "type": "future"}
-                   for code, name, exchange in FUTURES_LIST_CACHE]
-        return jsonify(stocks + futures)
-
-    # 缓存过期，从数据库加载
+                   for code, name, exchange in futures_list]
+        return stocks + futures
+
+    return cached_json_response(('symbols_list',), build)
+
+
+# 股票代码前缀 -> 交易所（新浪行情代码形如 sh600000）
+STOCK_CODE_PREFIXES = {'sh': 'SSE', 'sz': 'SZSE', 'bj': 'BSE'}
+
+# 行情快照：交易所:代码 -> 报价字段，由后台任务进程只为近期被请求过的符号刷新并发布到共享状态，/quotes 只做字典查找
+QUOTE_REQUESTED = {}  # 本进程被请求报价的符号 -> 最近请求时刻
+QUOTE_REQUEST_PENDING = {}  # 尚未写入 quote_requests 的符号 -> 最近请求时刻（汇总到后台任务进程）
+QUOTE_REQUEST_LOCK = threading.Lock()
+QUOTE_REQUEST_PUBLISHED = 0  # 本进程最近一次写入 quote_requests 的时刻
+QUOTE_REFRESH_INTERVAL = 30  # 新浪全市场行情需分页拉取，频繁调用会被临时封IP
+QUOTE_IDLE_TIMEOUT = 300  # 只刷新该时间内被请求过的符号，全部过期时暂停刷新
+QUOTE_FUTURES_BATCH = 50  # 期货行情每次请求的合约数
+# 被请求的股票不超过该数量时逐个拉取东方财富报价，否则拉取一次新浪全市场行情
+QUOTE_STOCK_SINGLE_MAX = 20
+QUOTE_WAKEUP = threading.Event()
+
+
+def split_stock_codes(values):
+    """向量化地将股票代码拆分为 (代码, 交易所)，兼容 sh600000 与 600000 两种格式
+
+    无法识别交易所的代码对应空字符串
+    """
+    raw = pd.Series(values).astype(str).str.strip().str.lower()
+    parts = raw.str.extract(r'^([a-z]*)(\d+)$')
+    codes = parts[1].fillna('')
+    by_digit = np.select(
+        [codes.str.startswith('6'), codes.str.startswith(('0', '3')), codes.str.startswith(('8', '4'))],
+        ['SSE', 'SZSE', 'BSE'], default='')
+    exchanges = parts[0].map(STOCK_CODE_PREFIXES).fillna(pd.Series(by_digit, index=raw.index))
+    return codes, exchanges
+
+
+def quote_column(df, possible_cols):
+    """按候选列名取数值列，缺失时返回全NaN"""
+    found_col = next((col for col in possible_cols if col in df.columns), None)
+    if found_col is None:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[found_col], errors='coerce').to_numpy(dtype='float64')
+
+
+def build_quotes(tickers, names, exchanges, columns):
+    """按列组装UDF报价字段，返回 {交易所:代码: 报价}，NaN 输出为 None"""
+    lp, prev_close = columns['lp'], columns['prev_close_price']
+    if 'ch' not in columns:
+        columns['ch'] = lp - prev_close
+    if 'chp' not in columns:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns['chp'] = np.where(prev_close > 0, columns['ch'] / prev_close * 100, np.nan)
+
+    fields = list(columns)
+    values = [[None if v != v else v for v in np.round(columns[field], 4).tolist()] for field in fields]
+
+    quotes = {}
+    for ticker, name, exchange, *row in zip(tickers, names, exchanges, *values):
+        quote = dict(zip(fields, row))
+        quote.update(short_name=name, description=name, exchange=exchange, original_name=ticker)
+        quotes[ticker] = quote
+    return quotes
+
+
+def build_stock_quotes(df):
+    """将 stock_zh_a_spot（或 stock_zh_a_spot_em）的结果整理为报价"""
+    code_col = next((col for col in ['代码', 'symbol', '股票代码'] if col in df.columns), None)
+    name_col = next((col for col in ['名称', 'name', '股票名称'] if col in df.columns), None)
+    if code_col is None or name_col is None:
+        raise ValueError(f"无法识别股票行情列名: {df.columns.tolist()}")
+
+    codes, exchanges = split_stock_codes(df[code_col])
+    valid = (exchanges != '').to_numpy()
+    df = df[valid]
+    codes, exchanges = codes[valid], exchanges[valid]
+    columns = {
+        'lp': quote_column(df, ['最新价', 'trade']),
+        'ch': quote_column(df, ['涨跌额']),
+        'chp': quote_column(df, ['涨跌幅']),
+        'bid': quote_column(df, ['买入']),
+        'ask': quote_column(df, ['卖出']),
+        'open_price': quote_column(df, ['今开']),
+        'high_price': quote_column(df, ['最高']),
+        'low_price': quote_column(df, ['最低']),
+        'prev_close_price': quote_column(df, ['昨收']),
+        'volume': quote_column(df, ['成交量']),
+    }
+    tickers = (exchanges + ':' + codes).tolist()
+    return build_quotes(tickers, df[name_col].tolist(), exchanges.tolist(), columns)
+
+
+def build_bid_ask_quote(df, code, name, exchange):
+    """将 stock_bid_ask_em 的结果（item/value 两列）整理为单个股票的报价"""
+    row = pd.DataFrame([dict(zip(df['item'], df['value']))])
+    columns = {
+        'lp': quote_column(row, ['最新']),
+        'ch': quote_column(row, ['涨跌']),
+        'chp': quote_column(row, ['涨幅']),
+        'bid': quote_column(row, ['buy_1']),
+        'ask': quote_column(row, ['sell_1']),
+        'open_price': quote_column(row, ['今开']),
+        'high_price': quote_column(row, ['最高']),
+        'low_price': quote_column(row, ['最低']),
+        'prev_close_price': quote_column(row, ['昨收']),
+        # 单位为手，与全市场行情的成交量（股）保持一致
+        'volume': quote_column(row, ['总手']) * 100,
+    }
+    return build_quotes([f"{exchange}:{code}"], [name or code], [exchange], columns)
+
+
+def build_futures_quotes(df, contracts):
+    """将 futures_zh_spot 的结果整理为报价，contracts 为请求时的 (代码, 名称, 交易所) 列表
+
+    上游返回的 symbol 列是中文合约名，只能按请求顺序对应回合约代码
+    """
+    if len(df) != len(contracts):
+        raise ValueError(f"期货行情条数与请求不一致: {len(df)}/{len(contracts)}")
+
+    codes, names, exchanges = zip(*contracts)
+    prev_close = quote_column(df, ['last_settle_price'])
+    prev_close = np.where(np.isnan(prev_close), quote_column(df, ['last_close']), prev_close)
+    columns = {
+        'lp': quote_column(df, ['current_price']),
+        'bid': quote_column(df, ['bid_price']),
+        'ask': quote_column(df, ['ask_price']),
+        'open_price': quote_column(df, ['open']),
+        'high_price': quote_column(df, ['high']),
+        'low_price': quote_column(df, ['low']),
+        'prev_close_price': prev_close,
+        'volume': quote_column(df, ['volume']),
+    }
+    tickers = [f"{exchange}:{code}" for code, exchange in zip(codes, exchanges)]
+    names = [name or code for code, name in zip(codes, names)]
+    return build_quotes(tickers, names, exchanges, columns)
+
+
+def get_quote_snapshot():
+    """返回共享的行情快照 {'time': 更新时间, 'quotes': {交易所:代码: 报价}}"""
+    return SHARED_STATE.get('quotes', {'time': 0, 'quotes': {}})
+
+
+def record_quote_request(symbols):
+    """记录本进程被请求报价的符号，由 flush_quote_requests 汇总到 quote_requests，返回此前未被请求过的符号"""
+    now = time.time()
+    with QUOTE_REQUEST_LOCK:
+        added = [symbol for symbol in symbols if symbol not in QUOTE_REQUESTED]
+        for symbol in symbols:
+            QUOTE_REQUESTED[symbol] = now
+            QUOTE_REQUEST_PENDING[symbol] = now
+    return added
+
+
+def flush_quote_requests():
+    """将尚未写入的被请求符号排入单写线程（不等待落库），写入队列已满时留到下次，返回排入的符号数"""
+    global QUOTE_REQUEST_PENDING, QUOTE_REQUEST_PUBLISHED
+    with QUOTE_REQUEST_LOCK:
+        pending, QUOTE_REQUEST_PENDING = QUOTE_REQUEST_PENDING, {}
+        QUOTE_REQUEST_PUBLISHED = time.time()
+        # 本进程的记录只用于刷新，过期的无需保留
+        expired = [symbol for symbol, t in QUOTE_REQUESTED.items() if t < QUOTE_REQUEST_PUBLISHED - QUOTE_IDLE_TIMEOUT]
+        for symbol in expired:
+            del QUOTE_REQUESTED[symbol]
+    if not pending:
+        return 0
+
+    rows = [(symbol, int(t)) for symbol, t in pending.items()]
+    try:
+        submit_write(lambda conn: conn.executemany('''
+        INSERT INTO quote_requests (symbol, request_time) VALUES (?, ?)
+        ON CONFLICT(symbol) DO UPDATE SET request_time = MAX(request_time, excluded.request_time)
+        ''', rows), weight=len(rows), timeout=WRITE_QUEUE_TIMEOUT)
+    except queue.Full:
+        with QUOTE_REQUEST_LOCK:
+            for symbol, t in pending.items():
+                QUOTE_REQUEST_PENDING[symbol] = max(t, QUOTE_REQUEST_PENDING.get(symbol, 0))
+        return 0
+    return len(rows)
+
+
+def get_requested_quote_symbols(conn):
+    """近 QUOTE_IDLE_TIMEOUT 秒内被请求过报价的符号：各进程汇总到 quote_requests 的，加上本进程尚未写入的"""
+    since = time.time() - QUOTE_IDLE_TIMEOUT
+    symbols = {row[0] for row in conn.execute("SELECT symbol FROM quote_requests WHERE request_time >= ?",
+                                              (int(since),))}
+    with QUOTE_REQUEST_LOCK:
+        symbols.update(symbol for symbol, t in QUOTE_REQUESTED.items() if t >= since)
+    return symbols
+
+
+def refresh_quote_snapshot():
+    """只为近期被请求过的符号拉取行情并替换快照，某个来源失败时保留其上一次的报价，返回快照条数
+
+    上游调用都经 SYMBOL_FETCHER 限速：被请求的股票较少时逐个拉取东方财富报价，较多时拉取一次新浪全市场行情，
+    期货按合约分批请求新浪行情
+    """
+    start = time.perf_counter()
     conn = get_db_connection()
-    cursor = conn.cursor()
+    try:
+        requested = get_requested_quote_symbols(conn)
+        payload = current_app.json.dumps(sorted(requested))
+        stocks = [tuple(row) for row in conn.execute('''
+        SELECT code, name, exchange FROM stocks WHERE exchange || ':' || code IN (SELECT value FROM json_each(?))
+        ORDER BY code
+        ''', (payload,))]
+        contracts = [tuple(row) for row in conn.execute('''
+        SELECT code, name, exchange FROM futures WHERE exchange || ':' || code IN (SELECT value FROM json_each(?))
+        ORDER BY code
+        ''', (payload,))]
+    finally:
+        conn.close()
 
-    # 获取股票列表
-    cursor.execute("SELECT code, name, exchange FROM stocks ORDER BY code")
-    STOCK_LIST_CACHE = [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+    # 不再被请求的符号从快照中移除
+    snapshot = {ticker: quote for ticker, quote in get_quote_snapshot()['quotes'].items() if ticker in requested}
+
+    tasks = {}
+    if len(stocks) > QUOTE_STOCK_SINGLE_MAX:
+        tasks['stock'] = [('sina', require_rows(ak.stock_zh_a_spot))]
+    else:
+        for code, name, exchange in stocks:
+            tasks[(code, name, exchange)] = [('eastmoney_quote', require_rows(partial(ak.stock_bid_ask_em, symbol=code)))]
+
+    # 新浪期货行情：金融期货(FF)与商品期货(CF)分开请求，每次批量订阅多个合约
+    for market, market_contracts in (("FF", [c for c in contracts if c[2] == 'CFFEX']),
+                                     ("CF", [c for c in contracts if c[2] != 'CFFEX'])):
+        for i in range(0, len(market_contracts), QUOTE_FUTURES_BATCH):
+            batch = tuple(market_contracts[i:i + QUOTE_FUTURES_BATCH])
+            tasks[batch] = [('sina_hq', partial(ak.futures_zh_spot, symbol=",".join(code for code, _, _ in batch),
+                                                market=market, adjust='0'))]
+
+    results = SYMBOL_FETCHER.run(tasks, timeout=QUOTE_REFRESH_INTERVAL, logger=current_app.logger) if tasks else {}
+    for name, result in results.items():
+        try:
+            if isinstance(result, Exception):
+                raise result
+            if name == 'stock':
+                snapshot.update((ticker, quote) for ticker, quote in build_stock_quotes(result).items()
+                                if ticker in requested)
+            elif isinstance(name[0], tuple):
+                snapshot.update(build_futures_quotes(result, name))
+            else:
+                snapshot.update(build_bid_ask_quote(result, *name))
+        except Exception as e:
+            target = "股票" if name == 'stock' or not isinstance(name[0], tuple) else f"期货（{name[0][0]}等{len(name)}个合约）"
+            current_app.logger.warning(f"{target}行情快照更新失败: {e}")
 
-    # 获取期货列表
-    cursor.execute("SELECT code, name, exchange FROM futures ORDER BY code")
-    FUTURES_LIST_CACHE = [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+    SHARED_STATE.publish('quotes', {'time': time.time(), 'quotes': snapshot}).result()
+    current_app.logger.debug(f"行情快照已更新: {len(requested)}个被请求的符号，{len(tasks)}次上游请求，"
+                             f"{time.perf_counter() - start:.2f}秒")
+    return len(snapshot)
 
-    conn.close()
-    LAST_CACHE_UPDATE = current_time
 
-    # 格式化返回
-    stocks = [{"code": code, "name": name, "exchange": exchange, "type": "stock"}
-              for code, name, exchange in STOCK_LIST_CACHE]
-    futures = [{"code": code, "name": name, "exchange": exchange, "type": "future"}
-               for code, name, exchange in FUTURES_LIST_CACHE]
+def prune_quote_requests():
+    """删除 quote_requests 中已过期的记录（不等待落库），写入队列已满时留到下次"""
+    since = int(time.time() - QUOTE_IDLE_TIMEOUT)
+    try:
+        submit_write(lambda conn: conn.execute("DELETE FROM quote_requests WHERE request_time < ?", (since,)),
+                     timeout=WRITE_QUEUE_TIMEOUT)
+    except queue.Full:
+        pass
 
-    return jsonify(stocks + futures)
+
+def update_quote_snapshot():
+    """定时刷新行情快照，无人请求报价时暂停；本进程收到请求后立即恢复，其他进程的请求在下一个刷新周期恢复"""
+    while True:
+        QUOTE_WAKEUP.wait(QUOTE_REFRESH_INTERVAL)
+        conn = get_db_connection()
+        try:
+            active = bool(get_requested_quote_symbols(conn))
+        finally:
+            conn.close()
+        if active:
+            try:
+                refresh_quote_snapshot()
+            except Exception as e:
+                current_app.logger.error(f"行情快照更新异常: {e}", exc_info=True)
+        prune_quote_requests()
+        # 刷新期间收到的唤醒已由本次刷新满足
+        QUOTE_WAKEUP.clear()
+
+
+@udf_bp.route('/quotes')
+@error_handler
+def quotes():
+    """批量获取报价，直接从行情快照中查找"""
+    symbols = [symbol for symbol in request.args.get('symbols', '').split(',') if symbol]
+
+    # 有新请求的符号或快照已停止刷新（空闲暂停或尚未启动）时唤醒后台刷新；刷新在其他进程中时，
+    # 新请求的符号立即汇总，其余的每个刷新周期最多汇总一次
+    now = time.time()
+    added = record_quote_request(symbols)
+    current = get_quote_snapshot()
+    snapshot = current['quotes']
+    if added or now - current['time'] > QUOTE_REFRESH_INTERVAL * 2:
+        QUOTE_WAKEUP.set()
+    if added or now - QUOTE_REQUEST_PUBLISHED > QUOTE_REFRESH_INTERVAL:
+        flush_quote_requests()
+
+    data = []
+    for symbol in symbols:
+        quote = snapshot.get(symbol)
+        if quote is None:
+            data.append({"s": "error", "n": symbol, "v": {}})
+        else:
+            data.append({"s": "ok", "n": symbol, "v": quote})
+    return jsonify({"s": "ok", "d": data})
+
+
+# 符号列表与行情快照数据源的限速（每秒请求数, 突发上限），未列出的数据源使用默认值；
+# 新浪全市场行情分页拉取，频繁调用会被临时封IP；新浪期货行情与东方财富个股报价为单次轻量请求
+SYMBOL_SOURCE_LIMITS = {'sina': (0.1, 1), 'sina_hq': (1, 2), 'eastmoney_quote': (2, 5)}
+SYMBOL_FETCHER = FetchScheduler(max_workers=8, rate_limits=SYMBOL_SOURCE_LIMITS, default_limit=(1, 2))
+SYMBOL_FETCH_TIMEOUT = 300  # 单次更新等待最慢数据源的上限（秒）
+SYMBOL_UPDATE_INTERVAL = 3600
+# 股票列表数量不低于现有的该比例时，才删除列表中已不存在的股票（退市），避免数据源返回不全时误删
+SYMBOL_PRUNE_MIN_RATIO = 0.9
+
+# 期货合约列表：数据源 -> (AKShare接口, 交易所, 接口是否需要交易日参数)
+FUTURES_CONTRACT_SOURCES = {
+    "cffex": (ak.futures_contract_info_cffex, 'CFFEX', True),
+    "czce": (ak.futures_contract_info_czce, 'CZCE', True),
+    "dce": (ak.futures_contract_info_dce, 'DCE', False),
+    "gfex": (ak.futures_contract_info_gfex, 'GFEX', False),
+    "ine": (ak.futures_contract_info_ine, 'INE', True),
+    "shfe": (ak.futures_contract_info_shfe, 'SHFE', True),
+}
+RECENT_TRADE_DAYS = 5  # 按日期查询的合约列表最多向前尝试的工作日数（跳过节假日）
+
+STATIC_STOCKS = [
+    ("600000", "浦发银行", "SSE"),
+    ("600036", "招商银行", "SSE"),
+    ("000001", "平安银行", "SZSE"),
+    ("000858", "五粮液", "SZSE"),
+    ("002594", "比亚迪", "SZSE"),
+]
+STATIC_FUTURES = [
+    ("IF2312", "沪深300指数期货", "CFFEX"),
+    ("IC2312", "中证500指数期货", "CFFEX"),
+    ("CU2312", "铜期货", "SHFE"),
+    ("AL2312", "铝期货", "SHFE"),
+    ("C2312", "玉米期货", "DCE"),
+    ("M2312", "豆粕期货", "DCE"),
+    ("CF2312", "棉花期货", "CZCE"),
+    ("SR2312", "白糖期货", "CZCE"),
+]
+
+
+def require_rows(fn):
+    """包装上游接口：返回空数据时视为失败，以便重试或换用备选数据源"""
+
+    def call():
+        df = fn()
+        if df is None or df.empty:
+            raise ValueError("返回空数据")
+        return df
+
+    return call
+
+
+def on_recent_trade_day(func):
+    """包装按交易日查询的接口：从今天起向前逐个工作日尝试，直到返回非空数据
+
+    节假日或尚未发布的日期上游可能直接抛出异常（解析空响应失败），同样视为该日无数据；
+    全部日期都抛出异常时抛出最后一次异常
+    """
+    logger = current_app.logger
+
+    def call():
+        error = None
+        for day in pd.bdate_range(end=pd.Timestamp.now(tz=MARKET_TZ).normalize(), periods=RECENT_TRADE_DAYS)[::-1]:
+            date = day.strftime('%Y%m%d')
+            try:
+                df = func(date=date)
+            except Exception as e:
+                logger.debug(f"{getattr(func, '__name__', func)} 在{date}无数据: {e}")
+                error = e
+                continue
+            if df is not None and not df.empty:
+                return df
+        if error is not None:
+            raise error
+        return None
+
+    return call
+
+
+def fetch_symbol_sources():
+    """并发拉取股票列表与各交易所期货合约列表
+
+    返回 (stock_df, {数据源: futures_df})，获取失败的数据源不在结果中（股票为None）
+    """
+    tasks = {"stock": [("sina", require_rows(ak.stock_zh_a_spot)),
+                       ("eastmoney", require_rows(ak.stock_zh_a_spot_em))]}
+    for source, (func, _, dated) in FUTURES_CONTRACT_SOURCES.items():
+        tasks[source] = [(source, require_rows(on_recent_trade_day(func) if dated else func))]
+
+    start = time.perf_counter()
+    results = SYMBOL_FETCHER.run(tasks, timeout=SYMBOL_FETCH_TIMEOUT, logger=current_app.logger)
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            current_app.logger.warning(f"符号列表数据源 {name} 获取失败: {result}")
+        else:
+            current_app.logger.debug(f"符号列表数据源 {name} 列名: {result.columns.tolist()}")
+    current_app.logger.info(f"符号列表数据源抓取完成，耗时{time.perf_counter() - start:.1f}秒")
+
+    stock_df = results.pop("stock")
+    futures_dfs = {name: df for name, df in results.items() if not isinstance(df, Exception)}
+    return (None if isinstance(stock_df, Exception) else stock_df), futures_dfs
+
+
+def parse_stock_list(stock_df):
+    """从股票行情中向量化提取 code/name/exchange 三列（DataFrame），无法识别时返回静态数据"""
+    if stock_df is None:
+        current_app.logger.error("无法获取股票列表数据，使用静态数据")
+        return pd.DataFrame(STATIC_STOCKS, columns=['code', 'name', 'exchange'])
+
+    code_col = next((col for col in ['代码', 'symbol', '股票代码'] if col in stock_df.columns), None)
+    name_col = next((col for col in ['名称', 'name', '股票名称'] if col in stock_df.columns), None)
+    if not code_col or not name_col:
+        current_app.logger.warning(f"无法识别股票数据列名: {stock_df.columns.tolist()}")
+        return pd.DataFrame(STATIC_STOCKS[:2], columns=['code', 'name', 'exchange'])
+
+    # 交易所取自代码前缀（sh/sz/bj）或代码首位，无法识别的代码丢弃
+    codes, exchanges = split_stock_codes(stock_df[code_col])
+    stocks = pd.DataFrame({'code': codes, 'name': stock_df[name_col].fillna('').astype(str).to_numpy(),
+                           'exchange': exchanges})
+    return stocks[stocks['exchange'] != ''].drop_duplicates('code').reset_index(drop=True)
+
+
+def parse_futures_list(futures_dfs):
+    """从各交易所合约列表中向量化提取 code/name/exchange 三列（DataFrame），无数据时返回静态数据
+
+    交易所取自数据源本身，名称缺失时用品种代码加合约代码
+    """
+    frames = []
+    for source, df in futures_dfs.items():
+        code_col = next((col for col in ['合约代码', '合约'] if col in df.columns), None)
+        if code_col is None:
+            current_app.logger.warning(f"期货数据源 {source} 缺少合约代码列: {df.columns.tolist()}")
+            continue
+        name_col = next((col for col in ['品种', '产品名称', '品种名称', '合约名称', '名称'] if col in df.columns), None)
+
+        codes = df[code_col].astype(str).str.strip()
+        names = df[name_col].fillna('').astype(str).str.strip() if name_col else pd.Series('', index=df.index)
+        default_names = codes.str.extract(r'^([A-Za-z]+)')[0].fillna('期货合约') + ' ' + codes
+        frames.append(pd.DataFrame({
+            'code': codes.to_numpy(),
+            'name': names.where(names != '', default_names).to_numpy(),
+            'exchange': FUTURES_CONTRACT_SOURCES[source][1],
+        }))
+
+    if not frames:
+        current_app.logger.error("无法获取期货列表数据，使用静态数据")
+        return pd.DataFrame(STATIC_FUTURES, columns=['code', 'name', 'exchange'])
+    futures = pd.concat(frames, ignore_index=True)
+    return futures[futures['code'] != ''].drop_duplicates('code').reset_index(drop=True)
+
+
+def changed_symbols(conn, table, symbols):
+    """与表中现有数据比较，返回新增或名称/交易所有变化的行"""
+    current = pd.read_sql_query(f"SELECT code, name AS old_name, exchange AS old_exchange FROM {table}", conn)
+    merged = symbols.merge(current, on='code', how='left')
+    changed = (merged['name'] != merged['old_name']) | (merged['exchange'] != merged['old_exchange'])
+    return symbols[changed.to_numpy()]
+
+
+def reload_symbol_caches():
+    """从数据库重新加载本进程的符号缓存：列表直接替换，符号信息置为过期（先返回旧值，后台逐个刷新），重建搜索索引"""
+    stock_list, futures_list = load_symbol_lists()
+    SYMBOL_LISTS.put('all', (stock_list, futures_list))
+    SYMBOL_INFO.invalidate()
+    rebuild_search_index(stock_list, futures_list)
+    RESPONSE_CACHE.invalidate()
+
+
+def refresh_symbol_caches():
+    """符号表变化后刷新本进程的缓存，并通知其他工作进程重新加载"""
+    global SYMBOLS_VERSION
+    reload_symbol_caches()
+    SYMBOLS_VERSION = SHARED_STATE.publish('symbols').result()
+
+
+@udf_bp.before_request
+def sync_shared_caches():
+    """其他进程更新了符号表时，在后台重新加载本进程的符号缓存（期间照常返回旧值）"""
+    global SYMBOLS_VERSION
+    version = SHARED_STATE.version('symbols')
+    if SYMBOLS_VERSION is None:
+        # 本进程的缓存尚未加载，首次使用时直接读取最新的符号表
+        SYMBOLS_VERSION = version
+    elif version != SYMBOLS_VERSION:
+        SYMBOLS_VERSION = version
+        SHARED_RELOAD.submit('symbols', with_app_context(reload_symbol_caches))
 
 
 def update_symbol_list():
-    """定时更新股票和期货列表到数据库"""
-    MAX_RETRIES = 3
-    RETRY_DELAY = 5  # 秒
-    import time
+    """定时更新股票和期货列表到数据库
 
+    各数据源并发抓取，全部返回后经单写线程在一个事务中写入
+    """
     while True:
-        for attempt in range(MAX_RETRIES):
+        try:
+            stock_df, futures_dfs = fetch_symbol_sources()
+            stocks = parse_stock_list(stock_df)
+            futures = parse_futures_list(futures_dfs)
+
+            # 只写入新增或有变化的行，update_time 为该行最近一次变化的时间
+            current_time = int(time.time())
+
+            def write(conn):
+                for table, symbols in (('stocks', stocks), ('futures', futures)):
+                    changed = changed_symbols(conn, table, symbols)
+                    save_symbols(conn, table, changed['code'], changed['name'], changed['exchange'],
+                                 update_time=current_time)
+                    current_app.logger.info(f"{table}: 共{len(symbols)}个，新增或变化{len(changed)}个")
+
+                # 取到完整的股票列表时，删除已不在列表中的股票（退市）
+                if stock_df is None:
+                    return []
+                current = pd.read_sql_query("SELECT code, exchange FROM stocks", conn)
+                delisted = current[~current['code'].isin(stocks['code'])]
+                if delisted.empty or len(stocks) < SYMBOL_PRUNE_MIN_RATIO * len(current):
+                    return []
+                conn.executemany("DELETE FROM stocks WHERE code = ?", zip(delisted['code']))
+                return (delisted['exchange'] + ':' + delisted['code']).tolist()
+
+            delisted = submit_write(write, weight=len(stocks) + len(futures)).result()
+            if delisted:
+                current_app.logger.info(f"删除退市股票{len(delisted)}个，清除序列{purge_symbols(delisted)}个")
+
+            refresh_symbol_caches()
+            current_app.logger.info("符号列表更新成功")
+            PREWARM_EVENT.set()
+
+        except Exception as e:
+            current_app.logger.error(f"更新符号列表失败: {e}", exc_info=True)
+
+        # 每小时更新一次
+        time.sleep(SYMBOL_UPDATE_INTERVAL)
+
+
+def archive_months(bars, row_start):
+    """按月（北京时间）划分K线的行范围，返回清单行 [(月份, 起始行, 行数, 首根时间, 末根时间)]"""
+    timestamps = bars['timestamp'].to_numpy()
+    local = pd.to_datetime(timestamps, unit='s', utc=True).tz_convert(MARKET_TZ)
+    months = np.asarray(local.year * 100 + local.month)
+    bounds = np.flatnonzero(np.diff(months)) + 1
+    starts = np.r_[0, bounds]
+    ends = np.r_[bounds, len(months)]
+    return [(int(months[start]), row_start + int(start), int(end - start), int(timestamps[start]),
+             int(timestamps[end - 1])) for start, end in zip(starts, ends)]
+
+
+def archive_series(series_id, cutoff):
+    """将序列中 cutoff 之前的K线从 history_bars 移入归档，返回归档的K线数"""
+    conn = get_db_connection()
+    try:
+        bars = pd.read_sql_query('''
+        SELECT timestamp, open, high, low, close, volume FROM history_bars
+        WHERE series_id = ? AND timestamp < ? ORDER BY timestamp
+        ''', conn, params=(series_id, cutoff))
+        version, rows, last_time = conn.execute('''
+        SELECT MAX(version), MAX(row_start + row_count), MAX(last_time) FROM history_archive WHERE series_id = ?
+        ''', (series_id,)).fetchone()
+    finally:
+        conn.close()
+    # 序列清空后的旧版本尚未删除时暂不归档，避免新文件随旧版本一起被删除
+    if bars.empty or (version is None and series_id in ARCHIVE_RETIRED):
+        return 0
+
+    replace = last_time is not None and int(bars['timestamp'].iloc[0]) <= last_time
+    if not replace:
+        # 全部晚于已归档的数据：追加到文件末尾
+        version, rows = version or 0, rows or 0
+        months = archive_months(bars, rows)
+        ARCHIVE.append(series_id, version, rows, bars)
+    else:
+        # 有早于或重叠已归档的数据（如回补的更早历史）：合并后写为新版本，库内数据优先
+        archived = ARCHIVE.read(series_id, version, 0, rows, 0, 2 ** 62)
+        merged = pd.concat([archived, bars], ignore_index=True).drop_duplicates('timestamp', keep='last')
+        merged = merged.sort_values('timestamp', ignore_index=True)
+        version += 1
+        ARCHIVE.rewrite(series_id, version, merged)
+        months = archive_months(merged, 0)
+
+    # 清单更新与删除库内K线在同一事务中：读取方要么看到搬移前、要么看到搬移后
+    timestamps = bars['timestamp'].tolist()
+
+    def write(conn):
+        if replace:
+            conn.execute("DELETE FROM history_archive WHERE series_id = ?", (series_id,))
+        # 追加时本月可能已有部分归档（行范围相接），累加行数
+        conn.executemany('''
+        INSERT INTO history_archive (series_id, month, version, row_start, row_count, first_time, last_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(series_id, month) DO UPDATE SET
+            row_count = row_count + excluded.row_count, last_time = excluded.last_time
+        ''', [(series_id, month, version, start, count, first, last) for month, start, count, first, last in months])
+        conn.executemany("DELETE FROM history_bars WHERE series_id = ? AND timestamp = ?",
+                         zip(repeat(series_id), timestamps))
+
+    submit_write(write, weight=len(bars)).result()
+    if replace:
+        retire_archive(series_id, version)
+    return len(bars)
+
+
+def retire_archive(series_id, keep):
+    """记录序列重写（keep 为保留的版本）或清空（keep=None）后待删除的旧归档版本"""
+    ARCHIVE_RETIRED[series_id] = (keep, time.time())
+
+
+def remove_retired_archives():
+    """删除重写或清空已超过 ARCHIVE_RETIRE_GRACE 的旧归档版本"""
+    now = time.time()
+    for series_id, (keep, retired_at) in list(ARCHIVE_RETIRED.items()):
+        if now - retired_at >= ARCHIVE_RETIRE_GRACE:
+            ARCHIVE.remove_versions(series_id, keep=keep)
+            del ARCHIVE_RETIRED[series_id]
+
+
+def archive_history():
+    """将已结束月份（北京时间本月之前）的K线从 history_bars 移入列式归档，返回归档的K线数"""
+    remove_retired_archives()
+
+    cutoff = int(pd.Timestamp.now(tz=MARKET_TZ).normalize().replace(day=1).timestamp())
+    conn = get_db_connection()
+    try:
+        series = [row[0] for row in conn.execute('''
+        SELECT series_id FROM history_series s
+        WHERE (SELECT MIN(timestamp) FROM history_bars b WHERE b.series_id = s.series_id) < ?
+        ''', (cutoff,))]
+    finally:
+        conn.close()
+
+    start = time.perf_counter()
+    total = 0
+    for series_id in series:
+        try:
+            total += archive_series(series_id, cutoff)
+        except Exception as e:
+            current_app.logger.warning(f"归档序列{series_id}失败: {e}")
+    current_app.logger.info(f"归档完成: {len(series)}个序列，{total}根K线，耗时{time.perf_counter() - start:.1f}秒")
+    return total
+
+
+# 各基础周期的保留期限（天），None 为永久保留
+RETENTION_DAYS = {'1': 90, '5': 365, '15': 3 * 365, '30': 3 * 365, '60': 5 * 365, 'D': None}
+# K线存储（数据库已用页 + 归档）的磁盘预算（字节），超出时按访问次数淘汰冷门序列，直到预算的该比例以下
+STORAGE_BUDGET = 8 * 1024 ** 3
+STORAGE_EVICT_TARGET = 0.9
+# 该时长（秒）内访问过的序列不淘汰
+EVICT_PROTECT_WINDOW = 7 * 86400
+# 期货合约交割月结束后保留的天数
+CONTRACT_EXPIRY_GRACE_DAYS = 30
+# 数据库空闲页占比超过该值时压缩
+COMPACT_MIN_FREE_RATIO = 0.2
+
+
+def storage_usage(conn):
+    """K线存储用量（字节）：数据库已用页加归档数据"""
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    archived = conn.execute("SELECT COALESCE(SUM(row_count), 0) FROM history_archive").fetchone()[0]
+    return (page_count - freelist) * page_size + archived * BYTES_PER_BAR
+
+
+def purge_series(series):
+    """删除序列 [(series_id, symbol, resolution)] 的全部K线、归档与覆盖区间（序列ID保留，不会复用）"""
+    if not series:
+        return
+
+    def write(conn):
+        for series_id, symbol, resolution in series:
+            conn.execute("DELETE FROM history_bars WHERE series_id = ?", (series_id,))
+            conn.execute("DELETE FROM history_archive WHERE series_id = ?", (series_id,))
+            conn.execute("DELETE FROM history_coverage WHERE symbol = ? AND resolution = ?", (symbol, resolution))
+
+    submit_write(write, weight=len(series)).result()
+    for series_id, symbol, resolution in series:
+        BAR_CACHE.discard((symbol, resolution))
+        retire_archive(series_id, None)
+
+
+def purge_symbols(symbols):
+    """清除已退市股票或已到期合约的全部数据与统计，返回清除的序列数"""
+    payload = current_app.json.dumps(symbols)
+    conn = get_db_connection()
+    try:
+        series = [tuple(row) for row in conn.execute('''
+        SELECT series_id, symbol, resolution FROM history_series WHERE symbol IN (SELECT value FROM json_each(?))
+        ''', (payload,))]
+    finally:
+        conn.close()
+
+    purge_series(series)
+
+    def write(conn):
+        for table in ('symbol_access', 'backfill_progress'):
+            conn.execute(f"DELETE FROM {table} WHERE symbol IN (SELECT value FROM json_each(?))", (payload,))
+
+    submit_write(write).result()
+    return len(series)
+
+
+def trim_series(series_id, symbol, resolution, cutoff):
+    """删除序列 cutoff 之前的K线：库内直接删除，归档保留的部分重写为新版本，覆盖区间随之截断"""
+    conn = get_db_connection()
+    try:
+        version, rows, first_time = conn.execute('''
+        SELECT MAX(version), MAX(row_start + row_count), MIN(first_time) FROM history_archive WHERE series_id = ?
+        ''', (series_id,)).fetchone()
+    finally:
+        conn.close()
+
+    months = None
+    if first_time is not None and first_time < cutoff:
+        kept = ARCHIVE.read(series_id, version, 0, rows, cutoff, 2 ** 62)
+        months = []
+        if not kept.empty:
+            version += 1
+            ARCHIVE.rewrite(series_id, version, kept)
+            months = archive_months(kept, 0)
+
+    def write(conn):
+        conn.execute("DELETE FROM history_bars WHERE series_id = ? AND timestamp < ?", (series_id, cutoff))
+        # 覆盖区间已合并、互不重叠，截断后不会冲突
+        conn.execute("DELETE FROM history_coverage WHERE symbol = ? AND resolution = ? AND range_end < ?",
+                     (symbol, resolution, cutoff))
+        conn.execute('''
+        UPDATE history_coverage SET range_start = ? WHERE symbol = ? AND resolution = ? AND range_start < ?
+        ''', (cutoff, symbol, resolution, cutoff))
+        if months is not None:
+            conn.execute("DELETE FROM history_archive WHERE series_id = ?", (series_id,))
+            conn.executemany('''
+            INSERT INTO history_archive (series_id, month, version, row_start, row_count, first_time, last_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(series_id, month, version, start, count, first, last) for month, start, count, first, last in months])
+
+    submit_write(write).result()
+    if months is not None:
+        retire_archive(series_id, version if months else None)
+
+
+def apply_retention():
+    """按 RETENTION_DAYS 删除各周期超出保留期限的K线，返回处理的序列数"""
+    now = int(time.time())
+    count = 0
+    for resolution, days in RETENTION_DAYS.items():
+        if days is None:
+            continue
+        cutoff = now - days * 86400
+        conn = get_db_connection()
+        try:
+            series = [tuple(row) for row in conn.execute('''
+            SELECT series_id, symbol FROM history_series s
+            WHERE resolution = ? AND ((SELECT MIN(timestamp) FROM history_bars b WHERE b.series_id = s.series_id) < ?
+                OR EXISTS (SELECT 1 FROM history_archive a WHERE a.series_id = s.series_id AND a.first_time < ?))
+            ''', (resolution, cutoff, cutoff))]
+        finally:
+            conn.close()
+
+        for series_id, symbol in series:
             try:
-                db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'symbols.db')
-                conn = sqlite3.connect(db_path, timeout=10)
-                cursor = conn.cursor()
-                current_time = int(time.time())
-
-                # 更新股票列表
-                stock_df = None
-                stock_interfaces = [
-                    ("stock_zh_a_spot", ak.stock_zh_a_spot),
-                    ("stock_zh_a_spot_em", lambda: ak.stock_zh_a_spot_em()),
-                ]
-
-                for stock_attempt in range(MAX_RETRIES):
-                    for name, func in stock_interfaces:
-                        try:
-                            stock_df = func()
-                            if stock_df is not None and not stock_df.empty:
-                                current_app.logger.debug(f"使用股票接口 {name}，列名: {stock_df.columns.tolist()}")
-                                break
-                        except Exception as e:
-                            current_app.logger.warning(f"股票接口 {name} 调用失败: {e}")
-                            continue
-
-                    if stock_df is not None and not stock_df.empty:
-                        break
-
-                    if stock_attempt < MAX_RETRIES - 1:
-                        time.sleep(RETRY_DELAY)
-
-                if stock_df is None or stock_df.empty:
-                    current_app.logger.error("无法获取股票列表数据，使用静态数据")
-                    static_stocks = [
-                        ("600000", "浦发银行", "SSE"),
-                        ("600036", "招商银行", "SSE"),
-                        ("000001", "平安银行", "SZSE"),
-                        ("000858", "五粮液", "SZSE"),
-                        ("002594", "比亚迪", "SZSE"),
-                    ]
-                    for code, name, exchange in static_stocks:
-                        cursor.execute('''
-                        INSERT OR REPLACE INTO stocks (code, name, exchange, update_time)
-                        VALUES (?, ?, ?, ?)
-                        ''', (code, name, exchange, current_time))
-                else:
-                    code_col = next((col for col in ['代码', 'symbol', '股票代码'] if col in stock_df.columns), None)
-                    name_col = next((col for col in ['名称', 'name', '股票名称'] if col in stock_df.columns), None)
-
-                    if not code_col or not name_col:
-                        current_app.logger.warning(f"无法识别股票数据列名: {stock_df.columns.tolist()}")
-                        static_stocks = [
-                            ("600000", "浦发银行", "SSE"),
-                            ("600036", "招商银行", "SSE"),
-                        ]
-                        for code, name, exchange in static_stocks:
-                            cursor.execute('''
-                            INSERT OR REPLACE INTO stocks (code, name, exchange, update_time)
-                            VALUES (?, ?, ?, ?)
-                            ''', (code, name, exchange, current_time))
-                    else:
-                        count = 0
-                        for _, row in stock_df.iterrows():
-                            # 限制导入数量，避免过多数据
-                            if count > 1000:
-                                break
-
-                            try:
-                                code = row[code_col]
-                                name = row[name_col]
-                                code = str(code)
-
-                                if code.startswith('6'):
-                                    exchange = 'SSE'
-                                elif code.startswith(('0', '3')):
-                                    exchange = 'SZSE'
-                                elif code.startswith(('8', '4')):
-                                    exchange = 'BSE'
-                                else:
-                                    continue
-
-                                cursor.execute('''
-                                INSERT OR REPLACE INTO stocks (code, name, exchange, update_time)
-                                VALUES (?, ?, ?, ?)
-                                ''', (code, name, exchange, current_time))
-                                count += 1
-                            except Exception as e:
-                                current_app.logger.warning(f"处理股票数据失败: {e}")
-                                continue
-
-                # 更新期货列表
-                futures_df = None
-                for futures_attempt in range(MAX_RETRIES):
-                    try:
-                        available_futures_interfaces = [
-                            ("cffex", ak.futures_contract_info_cffex),
-                            ("czce", ak.futures_contract_info_czce),
-                            ("gfex", ak.futures_contract_info_gfex),
-                            ("ine", ak.futures_contract_info_ine),
-                            ("shfe", ak.futures_contract_info_shfe)
-                        ]
-
-                        dfs = []
-                        for name, func in available_futures_interfaces:
-                            try:
-                                df = func()
-                                if df is not None and not df.empty:
-                                    current_app.logger.debug(f"期货接口 {name} 列名: {df.columns.tolist()}")
-                                    if '合约代码' in df.columns:
-                                        dfs.append(df)
-                            except Exception as e:
-                                current_app.logger.warning(f"期货接口 {name} 调用失败: {e}")
-                                continue
-
-                        if dfs:
-                            futures_df = pd.concat(dfs, ignore_index=True)
-
-                        if futures_df is not None and not futures_df.empty:
-                            break
-                    except Exception as e:
-                        current_app.logger.warning(f"获取期货列表失败（尝试 {futures_attempt + 1}/{MAX_RETRIES}）: {e}")
-                        if futures_attempt < MAX_RETRIES - 1:
-                            time.sleep(RETRY_DELAY)
-
-                if futures_df is None or futures_df.empty:
-                    current_app.logger.error("无法获取期货列表数据，使用静态数据")
-                    static_futures = [
-                        ("IF2312", "沪深300指数期货", "CFFEX"),
-                        ("IC2312", "中证500指数期货", "CFFEX"),
-                        ("CU2312", "铜期货", "SHFE"),
-                        ("AL2312", "铝期货", "SHFE"),
-                        ("C2312", "玉米期货", "DCE"),
-                        ("M2312", "豆粕期货", "DCE"),
-                        ("CF2312", "棉花期货", "CZCE"),
-                        ("SR2312", "白糖期货", "CZCE"),
-                    ]
-                    for code, name, exchange in static_futures:
-                        cursor.execute('''
-                        INSERT OR REPLACE INTO futures (code, name, exchange, update_time)
-                        VALUES (?, ?, ?, ?)
-                        ''', (code, name, exchange, current_time))
-                else:
-                    code_col = '合约代码'
-                    possible_name_cols = ['品种', '产品名称', '合约名称', '名称']
-                    name_col = next((col for col in possible_name_cols if col in futures_df.columns), None)
-
-                    if not name_col:
-                        current_app.logger.warning("未找到明确的名称列，使用'合约代码'作为名称")
-                        name_col = '合约代码'
-
-                    if code_col:
-                        count = 0
-                        for _, row in futures_df.iterrows():
-                            if count > 500:
-                                break
-
-                            try:
-                                code = row[code_col]
-                                code = str(code)
-
-                                if name_col in row:
-                                    name = row[name_col]
-                                    if not name or str(name).strip() == "":
-                                        name = None
-                                else:
-                                    name = None
-
-                                # 生成默认名称
-                                if name is None:
-                                    if len(code) >= 2 and code[:2].isalpha():
-                                        base_name = code[:2]
-                                    elif len(code) >= 3 and code[:3].isalpha():
-                                        base_name = code[:3]
-                                    else:
-                                        base_name = "期货合约"
-
-                                    name = f"{base_name} {code}"
-
-                                # 确定交易所
-                                if 'cffex' in str(row) or code.startswith(('IF', 'IC', 'IH', 'T', 'TF', 'TS')):
-                                    exchange = 'CFFEX'
-                                elif 'shfe' in str(row) or code.startswith(
-                                        ('CU', 'AL', 'ZN', 'PB', 'NI', 'SN', 'AU', 'AG')):
-                                    exchange = 'SHFE'
-                                elif 'dce' in str(row) or code.startswith(('C', 'M', 'Y', 'P', 'J', 'JM')):
-                                    exchange = 'DCE'
-                                elif 'czce' in str(row) or code.startswith(('CF', 'SR', 'TA', 'MA')):
-                                    exchange = 'CZCE'
-                                elif 'ine' in str(row) or code.startswith(('SC', 'LU', 'NR')):
-                                    exchange = 'INE'
-                                elif 'gfex' in str(row) or code.startswith(('SI', 'AU')):
-                                    exchange = 'GFEX'
-                                else:
-                                    exchange = 'OTHER'
-
-                                cursor.execute('''
-                                INSERT OR REPLACE INTO futures (code, name, exchange, update_time)
-                                VALUES (?, ?, ?, ?)
-                                ''', (code, name, exchange, current_time))
-                                count += 1
-                            except Exception as e:
-                                current_app.logger.warning(f"处理期货数据失败: {e}")
-                                continue
-
-                conn.commit()
-                conn.close()
+                trim_series(series_id, symbol, resolution, cutoff)
+                count += 1
+            except Exception as e:
+                current_app.logger.warning(f"裁剪{symbol}的{resolution}数据失败: {e}")
+    return count
 
-                # 更新缓存
-                global STOCK_LIST_CACHE, FUTURES_LIST_CACHE, LAST_CACHE_UPDATE
-                conn = sqlite3.connect(db_path, timeout=10)
-                cursor = conn.cursor()
-                STOCK_LIST_CACHE = [(row[0], row[1], row[2]) for row in
-                                    cursor.execute("SELECT code, name, exchange FROM stocks")]
-                FUTURES_LIST_CACHE = [(row[0], row[1], row[2]) for row in
-                                      cursor.execute("SELECT code, name, exchange FROM futures")]
-                conn.close()
-                LAST_CACHE_UPDATE = current_time
 
-                current_app.logger.info("符号列表更新成功")
+def expired_contracts(codes, now):
+    """按合约代码中的交割年月（YYMM，郑商所为YMM）找出交割月结束已超过 CONTRACT_EXPIRY_GRACE_DAYS 的合约，返回布尔数组"""
+    digits = codes.str.extract(r'^[A-Za-z]+(\d{3,4})$')[0]
+    valid = digits.notna().to_numpy()
+    digits = digits.fillna('0001')
+    month = digits.str[-2:].astype(int).to_numpy()
+    year = digits.str[:-2].astype(int).to_numpy()
+
+    cutoff = pd.Timestamp(now - CONTRACT_EXPIRY_GRACE_DAYS * 86400, unit='s', tz='UTC').tz_convert(MARKET_TZ)
+    # 郑商所年份只有一位：取 [今年-5, 今年+4] 中个位相同的年份
+    base = cutoff.year - 5
+    year = np.where(digits.str.len().to_numpy() == 4, 2000 + year, base + (year - base) % 10)
+    # 交割月早于（当前时间 - 宽限期）所在的月份即已到期
+    return valid & (month >= 1) & (month <= 12) & (year * 12 + month < cutoff.year * 12 + cutoff.month)
+
+
+def purge_expired_contracts():
+    """删除已到期的期货合约及其全部数据，返回删除的合约数"""
+    conn = get_db_connection()
+    try:
+        futures = pd.read_sql_query("SELECT code, exchange FROM futures", conn)
+    finally:
+        conn.close()
+    expired = futures[expired_contracts(futures['code'], time.time())]
+    if expired.empty:
+        return 0
+
+    submit_write(lambda conn: conn.executemany("DELETE FROM futures WHERE code = ?", zip(expired['code']))).result()
+    purged = purge_symbols((expired['exchange'] + ':' + expired['code']).tolist())
+    refresh_symbol_caches()
+    current_app.logger.info(f"删除到期合约{len(expired)}个，清除序列{purged}个")
+    return len(expired)
+
+
+def evict_cold_series():
+    """存储用量超出 STORAGE_BUDGET 时按访问次数从少到多淘汰序列（近期访问过的除外），返回淘汰的序列数"""
+    conn = get_db_connection()
+    try:
+        usage = storage_usage(conn)
+        if usage <= STORAGE_BUDGET:
+            return 0
+        archived_rows = conn.execute("SELECT COALESCE(SUM(row_count), 0) FROM history_archive").fetchone()[0]
+        db_rows = conn.execute("SELECT COUNT(*) FROM history_bars").fetchone()[0]
+        candidates = conn.execute('''
+        SELECT s.series_id, s.symbol, s.resolution,
+               (SELECT COUNT(*) FROM history_bars b WHERE b.series_id = s.series_id),
+               (SELECT COALESCE(SUM(row_count), 0) FROM history_archive a WHERE a.series_id = s.series_id)
+        FROM history_series s
+        LEFT JOIN symbol_access x ON x.symbol = s.symbol AND x.resolution = s.resolution
+        WHERE COALESCE(x.last_access, 0) < ?
+        ORDER BY COALESCE(x.hits, 0), COALESCE(x.last_access, 0)
+        ''', (int(time.time()) - EVICT_PROTECT_WINDOW,)).fetchall()
+    finally:
+        conn.close()
+
+    # 库内每行的平均占用按当前用量估算（含索引与页内空闲）
+    db_row_bytes = max(usage - archived_rows * BYTES_PER_BAR, 0) / max(db_rows, 1)
+    excess = usage - STORAGE_BUDGET * STORAGE_EVICT_TARGET
+    evicted = []
+    for series_id, symbol, resolution, db_count, archived_count in candidates:
+        if excess <= 0:
+            break
+        if db_count or archived_count:
+            evicted.append((series_id, symbol, resolution))
+            excess -= db_count * db_row_bytes + archived_count * BYTES_PER_BAR
+
+    purge_series(evicted)
+    current_app.logger.info(f"存储用量{usage / 1024 ** 2:.0f}MB超出预算，淘汰冷门序列{len(evicted)}个")
+    if excess > 0:
+        current_app.logger.warning(f"近期访问的序列已超出存储预算约{excess / 1024 ** 2:.0f}MB")
+    return len(evicted)
+
+
+def compact_database():
+    """数据库空闲页占比超过 COMPACT_MIN_FREE_RATIO 时压缩（经单写线程在事务外独占执行），返回是否压缩"""
+    conn = get_db_connection()
+    try:
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    if not page_count or freelist < page_count * COMPACT_MIN_FREE_RATIO:
+        return False
+
+    def vacuum(conn):
+        conn.execute("VACUUM")
+        # WAL 模式下 VACUUM 的结果先写入 WAL，检查点后截断
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    submit_write(vacuum, exclusive=True).result()
+    return True
+
+
+def maintain_storage():
+    """非交易时段的存储维护：保留期限裁剪、清理到期合约、超出预算时淘汰冷门序列、必要时压缩数据库"""
+    start = time.perf_counter()
+    trimmed = apply_retention()
+    expired = purge_expired_contracts()
+    evicted = evict_cold_series()
+    compacted = compact_database()
+    current_app.logger.info(f"存储维护完成: 裁剪{trimmed}个序列，到期合约{expired}个，淘汰{evicted}个序列，"
+                            f"{'已' if compacted else '未'}压缩，耗时{time.perf_counter() - start:.1f}秒")
+
+
+# 访问统计：请求线程只在内存中累计，由预热调度器定期合并写入 symbol_access
+ACCESS_STATS = Counter()
+ACCESS_STATS_LOCK = threading.Lock()
+ACCESS_FLUSH_INTERVAL = 300  # 各工作进程将访问统计落库的间隔（秒）
+
+# 预热：热点符号数、统计窗口（秒）、额外预热的指数成分（沪深300、中证500）
+PREWARM_TOP_N = 300
+PREWARM_ACCESS_WINDOW = 7 * 86400
+PREWARM_INDEXES = ['000300', '000905']
+# 预热的周期 -> 向前预热的时长（秒），分钟线只预热股票
+PREWARM_RESOLUTIONS = {'D': 2 * 365 * 86400, '5': 5 * 86400, '1': 2 * 86400}
+# 每日固定预热时刻（北京时间）：日盘、午盘、夜盘开盘前
+PREWARM_TIMES = ['08:50', '12:50', '20:50']
+PREWARM_TIMEOUT = 1800
+# 增量同步库中全部序列尾部的时刻（北京时间，日盘与夜盘收盘后）及单次同步的时间上限（秒）
+TAIL_SYNC_TIMES = ['15:40', '23:40']
+TAIL_SYNC_TIMEOUT = 3600
+# 非交易时段任务（维护存储、归档已结束的月份、深度回补）的每日开始时刻（北京时间，日盘与夜盘收盘后）
+OFFHOURS_TIMES = ['16:00', '00:00']
+
+# 深度回补：只在非交易时段进行，每步向前取一段日线，回补到该日期为止
+BACKFILL_RESOLUTION = 'D'
+BACKFILL_CHUNK = 3 * 365 * 86400
+BACKFILL_START = 631152000  # 1990-01-01
+BACKFILL_BATCH = 8
+# 存储用量达到预算的该比例后暂停回补，为读穿缓存留出空间
+BACKFILL_BUDGET_RATIO = 0.8
+# 交易时段判定用的北京时间窗口（当日分钟数，含盘前盘后的余量），其余时间视为非交易时段
+MARKET_HOURS = [(8 * 60 + 30, 15 * 60 + 30), (20 * 60 + 30, 23 * 60 + 30)]
+
+# 预热与回补各用一个有界线程池，回补并发与速率更低
+HISTORY_FETCHER = FetchScheduler(max_workers=4, rate_limits={'history': (4, 4)})
+BACKFILL_FETCHER = FetchScheduler(max_workers=2, rate_limits={'history': (1, 1)})
+
+INDEX_CONSTITUENTS = {}  # 指数代码 -> (日期, 成分股符号)，每天拉取一次
+PREWARM_EVENT = threading.Event()  # 符号列表更新完成后触发一次预热
+
+
+def record_access(symbol, resolution):
+    """记录一次K线访问（按基础周期统计）"""
+    with ACCESS_STATS_LOCK:
+        ACCESS_STATS[(symbol, resolution_base(resolution))] += 1
+
+
+def flush_access_stats():
+    """将内存中累计的访问次数合并写入 symbol_access，等待落库后返回写入的序列数"""
+    global ACCESS_STATS
+    with ACCESS_STATS_LOCK:
+        stats, ACCESS_STATS = ACCESS_STATS, Counter()
+    if not stats:
+        return 0
+
+    now = int(time.time())
+    rows = [(symbol, resolution, hits, now) for (symbol, resolution), hits in stats.items()]
+    submit_write(lambda conn: conn.executemany('''
+    INSERT INTO symbol_access (symbol, resolution, hits, last_access) VALUES (?, ?, ?, ?)
+    ON CONFLICT(symbol, resolution) DO UPDATE SET
+        hits = hits + excluded.hits, last_access = excluded.last_access
+    ''', rows), weight=len(rows)).result()
+    return len(rows)
+
+
+def get_index_constituents(index):
+    """获取指数成分股符号（交易所:代码），每天只向上游请求一次"""
+    today = pd.Timestamp.now(tz=MARKET_TZ).strftime('%Y%m%d')
+    cached = INDEX_CONSTITUENTS.get(index)
+    if cached is not None and cached[0] == today:
+        return cached[1]
+
+    df = SYMBOL_FETCHER.call('csindex', require_rows(lambda: ak.index_stock_cons_csindex(symbol=index)),
+                             current_app.logger)
+    codes, exchanges = split_stock_codes(df['成分券代码'])
+    symbols = [f"{exchange}:{code}" for code, exchange in zip(codes, exchanges) if exchange]
+    INDEX_CONSTITUENTS[index] = (today, symbols)
+    return symbols
+
+
+def get_hot_symbols(conn):
+    """热点符号：近期访问最多的符号，加上配置的指数成分股"""
+    rows = conn.execute('''
+    SELECT symbol FROM symbol_access WHERE last_access >= ?
+    GROUP BY symbol ORDER BY SUM(hits) DESC LIMIT ?
+    ''', (int(time.time()) - PREWARM_ACCESS_WINDOW, PREWARM_TOP_N)).fetchall()
+    symbols = [row[0] for row in rows]
+
+    for index in PREWARM_INDEXES:
+        try:
+            symbols.extend(get_index_constituents(index))
+        except Exception as e:
+            current_app.logger.warning(f"获取指数{index}成分股失败: {e}")
+    return list(dict.fromkeys(symbols))
+
+
+def is_market_hours(timestamp):
+    """是否处于交易时段（工作日的 MARKET_HOURS 窗口内），回补只在其他时间进行"""
+    local = pd.Timestamp(timestamp, unit='s', tz='UTC').tz_convert(MARKET_TZ)
+    if local.weekday() >= 5:
+        return False
+    clock = local.hour * 60 + local.minute
+    return any(start <= clock < end for start, end in MARKET_HOURS)
+
+
+def next_daily_time(timestamp, times):
+    """timestamp 之后最近的一个每日固定时刻（times 为北京时间 HH:MM 列表），返回Unix时间戳"""
+    local = pd.Timestamp(timestamp, unit='s', tz='UTC').tz_convert(MARKET_TZ)
+    candidates = [local.normalize() + pd.Timedelta(days=days, hours=int(at[:2]), minutes=int(at[3:]))
+                  for days in (0, 1) for at in times]
+    return min(candidate for candidate in candidates if candidate > local).timestamp()
+
+
+def next_prewarm_time(timestamp):
+    """timestamp 之后最近的一个固定预热时刻（Unix时间戳）"""
+    return next_daily_time(timestamp, PREWARM_TIMES)
+
+
+def tail_sync_scheduler():
+    """收盘后定时增量同步库中全部序列的尾部：每个序列只请求最后一根已存K线之后的缺口"""
+    while True:
+        time.sleep(max(0.0, next_daily_time(time.time(), TAIL_SYNC_TIMES) - time.time()))
+        try:
+            sync_history_tails()
+        except Exception as e:
+            current_app.logger.error(f"增量同步异常: {e}", exc_info=True)
+
+
+def prewarm_history(app, symbols):
+    """预热热点符号的日线和近期分钟线（经读穿缓存补齐缺失区间），返回成功的序列数"""
+
+    def warm(symbol, resolution, span):
+        def run():
+            with app.app_context():
+                now = int(time.time())
+                bars, upstream_error = get_history_bars(symbol, resolution, now - span, now)
+                if upstream_error is not None:
+                    raise upstream_error
+                return len(bars)
+
+        return run
+
+    tasks = {}
+    for symbol in symbols:
+        is_stock = symbol.split(':', 1)[0] in STOCK_EXCHANGES
+        for resolution, span in PREWARM_RESOLUTIONS.items():
+            if is_stock or resolution == 'D':
+                tasks[(symbol, resolution)] = [('history', warm(symbol, resolution, span))]
+
+    start = time.perf_counter()
+    results = HISTORY_FETCHER.run(tasks, timeout=PREWARM_TIMEOUT, logger=current_app.logger)
+    succeeded = sum(not isinstance(result, Exception) for result in results.values())
+    current_app.logger.info(f"预热完成: {len(symbols)}个符号，{succeeded}/{len(tasks)}个序列成功，"
+                            f"耗时{time.perf_counter() - start:.1f}秒")
+    return succeeded
+
+
+def backfill_history(app, symbols, deadline):
+    """低优先级回补深度日线：各序列从上次的位置继续向前，每轮每个序列取一段，进度写入 backfill_progress
+
+    只有该段已落库（覆盖区间已记录）时才推进进度，写入队列已满而放弃落库的段在后续轮次重试。
+    到达 deadline 或进入交易时段时停止，下次从记录的位置继续。返回本次完成的步数
+    """
+    conn = get_db_connection()
+    try:
+        progress = {row[0]: (row[1], row[2]) for row in conn.execute(
+            "SELECT symbol, next_end, done FROM backfill_progress WHERE resolution = ?", (BACKFILL_RESOLUTION,))}
+    finally:
+        conn.close()
+
+    # 尚无进度的序列从预热范围之前开始
+    initial_end = int(time.time()) - PREWARM_RESOLUTIONS[BACKFILL_RESOLUTION]
+    pending = [symbol for symbol in symbols if not progress.get(symbol, (None, 0))[1]]
+
+    def step(symbol, next_end):
+        def run():
+            with app.app_context():
+                start = max(next_end - BACKFILL_CHUNK, BACKFILL_START)
+                bars, upstream_error = get_history_bars(symbol, BACKFILL_RESOLUTION, start, next_end, cache=False)
+                if upstream_error is not None:
+                    raise upstream_error
+                # 整段无数据说明已早于上市日
+                return start, int(bars.empty or start <= BACKFILL_START)
+
+        return run
+
+    steps = 0
+    while pending and time.time() < deadline and not is_market_hours(time.time()):
+        # 背压：写入队列积压过半时等待，回补不挤占请求线程的落库
+        DB_WRITER.throttle(WRITE_QUEUE_SIZE // 2)
+        conn = get_db_connection()
+        try:
+            if storage_usage(conn) >= STORAGE_BUDGET * BACKFILL_BUDGET_RATIO:
+                current_app.logger.info("存储用量接近预算，暂停回补")
                 break
+        finally:
+            conn.close()
+        batch, pending = pending[:BACKFILL_BATCH], pending[BACKFILL_BATCH:]
+        tasks = {symbol: [('history', step(symbol, progress.get(symbol, (initial_end, 0))[0]))] for symbol in batch}
+        results = BACKFILL_FETCHER.run(tasks, timeout=PREWARM_TIMEOUT, logger=current_app.logger)
+
+        now = int(time.time())
+        updates = []
+        for symbol, result in results.items():
+            if isinstance(result, Exception):
+                current_app.logger.warning(f"回补{symbol}失败，下次继续: {result}")
+                continue
+            next_end = progress.get(symbol, (initial_end, 0))[0]
+            updates.append((symbol, BACKFILL_RESOLUTION, result[0], result[1], now, next_end))
+
+        def write(conn, updates=updates):
+            # 单写线程按提交顺序执行，此时各段K线的写入已执行（或已被放弃）
+            saved = [update for update in updates
+                     if not get_missing_ranges(conn, update[0], BACKFILL_RESOLUTION, update[2], update[5])]
+            conn.executemany('''
+            INSERT OR REPLACE INTO backfill_progress (symbol, resolution, next_end, done, update_time)
+            VALUES (?, ?, ?, ?, ?)
+            ''', [update[:5] for update in saved])
+            return {update[0] for update in saved}
+
+        saved = submit_write(write, weight=len(updates)).result()
+        for symbol, _, start, done, _, _ in updates:
+            if symbol in saved:
+                progress[symbol] = (start, done)
+            else:
+                current_app.logger.warning(f"回补{symbol}的数据未落库，下次重试该段")
+            if not (symbol in saved and done):
+                pending.append(symbol)  # 轮转到队尾，各序列交替推进
+        steps += len(saved)
 
-            except Exception as e:
-                current_app.logger.error(f"更新符号列表失败（尝试 {attempt + 1}/{MAX_RETRIES}）: {e}")
-                try:
-                    conn.close()
-                except:
-                    pass
+    DB_WRITER.flush()
+    current_app.logger.info(f"回补暂停: 本次{steps}步，剩余{len(pending)}个序列")
+    return steps
 
-                if attempt < MAX_RETRIES - 1:
-                    current_app.logger.info(f"{RETRY_DELAY}秒后重试...")
-                    time.sleep(RETRY_DELAY)
 
-        # 每小时更新一次
-        time.sleep(3600)
+def prewarm_scheduler(app):
+    """预热调度：符号列表更新后或到达固定预热时刻时预热热点符号"""
+    while True:
+        PREWARM_EVENT.wait(max(0.0, next_prewarm_time(time.time()) - time.time()))
+        PREWARM_EVENT.clear()
+        try:
+            flush_access_stats()
+            conn = get_db_connection()
+            try:
+                hot = get_hot_symbols(conn)
+            finally:
+                conn.close()
+
+            prewarm_history(app, hot)
+        except Exception as e:
+            current_app.logger.error(f"预热调度异常: {e}", exc_info=True)
+
+
+def offhours_scheduler(app):
+    """每日收盘后的固定时刻维护存储、归档已结束的月份并回补深度历史，回补在进入交易时段时暂停"""
+    while True:
+        time.sleep(max(0.0, next_daily_time(time.time(), OFFHOURS_TIMES) - time.time()))
+        if is_market_hours(time.time()):
+            continue
+        try:
+            maintain_storage()
+            archive_history()
+
+            flush_access_stats()
+            conn = get_db_connection()
+            try:
+                hot = get_hot_symbols(conn)
+            finally:
+                conn.close()
+            # 热点符号优先，其余股票随后；在下一次开始前留出余量
+            universe = list(dict.fromkeys(hot + [f"{exchange}:{code}" for code, _, exchange in get_symbol_lists()[0]]))
+            backfill_history(app, universe, next_daily_time(time.time(), OFFHOURS_TIMES) - 600)
+        except Exception as e:
+            current_app.logger.error(f"非交易时段任务异常: {e}", exc_info=True)
 
 
 def start_update_thread(app):
@@ -908,3 +3096,47 @@ def start_update_thread(app):
     thread = threading.Thread(target=run, daemon=True)
     thread.start()
     app.logger.info("符号更新线程已启动")
+
+    def run_quotes():
+        with app.app_context():
+            update_quote_snapshot()
+
+    threading.Thread(target=run_quotes, daemon=True).start()
+    app.logger.info("行情快照线程已启动")
+
+    def run_prewarm():
+        with app.app_context():
+            prewarm_scheduler(app)
+
+    threading.Thread(target=run_prewarm, daemon=True).start()
+    app.logger.info("历史数据预热线程已启动")
+
+    def run_tail_sync():
+        with app.app_context():
+            tail_sync_scheduler()
+
+    threading.Thread(target=run_tail_sync, daemon=True).start()
+    app.logger.info("收盘增量同步线程已启动")
+
+    def run_offhours():
+        with app.app_context():
+            offhours_scheduler(app)
+
+    threading.Thread(target=run_offhours, daemon=True).start()
+    app.logger.info("非交易时段任务线程已启动")
+
+
+def start_background_tasks(app):
+    """在每个工作进程中启动后台任务：访问统计定时落库；符号与行情更新、预热等只在竞选成功的一个进程中运行"""
+
+    def run_access_flush():
+        with app.app_context():
+            while True:
+                time.sleep(ACCESS_FLUSH_INTERVAL)
+                try:
+                    flush_access_stats()
+                except Exception as e:
+                    current_app.logger.warning(f"访问统计落库失败: {e}")
+
+    threading.Thread(target=run_access_flush, daemon=True).start()
+    UPDATER_ELECTION.run(lambda: start_update_thread(app))
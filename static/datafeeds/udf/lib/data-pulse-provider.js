@@ -1,9 +1,13 @@
 import { getErrorMessage, logMessage, } from './helpers';
 export class DataPulseProvider {
-    constructor(historyProvider, updateFrequency) {
+    constructor(historyProvider, updateFrequency, streamUrl) {
         this._subscribers = {};
         this._requestsPending = 0;
+        this._stream = null;
+        this._streamUpdateTimer = null;
         this._historyProvider = historyProvider;
+        // bars are pushed over a single SSE connection shared by all subscriptions when possible, polling is the fallback
+        this._streamUrl = streamUrl !== undefined && typeof EventSource !== 'undefined' ? streamUrl : null;
         setInterval(this._updateData.bind(this), updateFrequency);
     }
     subscribeBars(symbolInfo, resolution, newDataCallback, listenerGuid) {
@@ -17,14 +21,16 @@ export class DataPulseProvider {
             resolution: resolution,
             symbolInfo: symbolInfo,
         };
+        this._scheduleStreamUpdate();
         logMessage(`DataPulseProvider: subscribed for #${listenerGuid} - {${symbolInfo.name}, ${resolution}}`);
     }
     unsubscribeBars(listenerGuid) {
         delete this._subscribers[listenerGuid];
+        this._scheduleStreamUpdate();
         logMessage(`DataPulseProvider: unsubscribed for #${listenerGuid}`);
     }
     _updateData() {
-        if (this._requestsPending > 0) {
+        if (this._requestsPending > 0 || this._streamUrl !== null) {
             return;
         }
         this._requestsPending = 0;
@@ -42,6 +48,66 @@ export class DataPulseProvider {
             });
         }
     }
+    _scheduleStreamUpdate() {
+        // subscription changes made together (e.g. a layout with several charts) reopen the stream only once
+        if (this._streamUrl === null || this._streamUpdateTimer !== null) {
+            return;
+        }
+        this._streamUpdateTimer = setTimeout(() => {
+            this._streamUpdateTimer = null;
+            this._openStream();
+        }, 0);
+    }
+    _openStream() {
+        if (this._stream !== null) {
+            this._stream.close();
+            this._stream = null;
+        }
+        const channels = {};
+        // eslint-disable-next-line guard-for-in
+        for (const listenerGuid in this._subscribers) {
+            const subscriptionRecord = this._subscribers[listenerGuid];
+            const ticker = subscriptionRecord.symbolInfo.ticker || '';
+            channels[`${ticker}|${subscriptionRecord.resolution}`] = [ticker, subscriptionRecord.resolution];
+        }
+        const keys = Object.keys(channels);
+        if (this._streamUrl === null || keys.length === 0) {
+            return;
+        }
+        // one connection for all subscriptions: browsers allow only a few connections per origin
+        const symbols = encodeURIComponent(keys.map((key) => channels[key][0]).join(','));
+        const resolutions = encodeURIComponent(keys.map((key) => channels[key][1]).join(','));
+        const stream = new EventSource(`${this._streamUrl}/stream?symbols=${symbols}&resolutions=${resolutions}`);
+        stream.onmessage = (event) => {
+            this._onStreamDataReceived(JSON.parse(event.data));
+        };
+        stream.onerror = () => {
+            // CONNECTING means the browser reconnects by itself, CLOSED means the server refused the stream
+            if (stream.readyState === EventSource.CLOSED && this._stream === stream) {
+                logMessage('DataPulseProvider: stream closed, falling back to polling');
+                this._stream = null;
+                this._streamUrl = null;
+            }
+        };
+        this._stream = stream;
+    }
+    _onStreamDataReceived(message) {
+        // the server sends only changed bars: the closed previous bar (when a new one starts) and the last one
+        // eslint-disable-next-line guard-for-in
+        for (const listenerGuid in this._subscribers) {
+            const subscriptionRecord = this._subscribers[listenerGuid];
+            if ((subscriptionRecord.symbolInfo.ticker || '') !== message.symbol || subscriptionRecord.resolution !== message.resolution) {
+                continue;
+            }
+            for (const bar of message.bars) {
+                if (subscriptionRecord.lastBarTime !== null && bar.time < subscriptionRecord.lastBarTime) {
+                    continue;
+                }
+                subscriptionRecord.lastBarTime = bar.time;
+                subscriptionRecord.listener(bar);
+            }
+        }
+    }
     _updateDataForSubscriber(listenerGuid) {
         const subscriptionRecord = this._subscribers[listenerGuid];
         const rangeEndTime = parseInt((Date.now() / 1000).toString());
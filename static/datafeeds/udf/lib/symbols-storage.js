@@ -11,10 +11,10 @@ function symbolKey(symbol, currency, unit) {
     return symbol + (currency !== undefined ? '_%|#|%_' + currency : '') + (unit !== undefined ? '_%|#|%_' + unit : '');
 }
 export class SymbolsStorage {
-    constructor(datafeedUrl, datafeedSupportedResolutions, requester) {
-        this._exchangesList = ['NYSE', 'FOREX', 'AMEX'];
+    constructor(datafeedUrl, datafeedSupportedResolutions, requester, exchanges) {
         this._symbolsInfo = {};
         this._symbolsList = [];
+        this._exchangesList = exchanges !== undefined && exchanges.length > 0 ? exchanges : ['NYSE', 'FOREX', 'AMEX'];
         this._datafeedUrl = datafeedUrl;
         this._datafeedSupportedResolutions = datafeedSupportedResolutions;
         this._requester = requester;
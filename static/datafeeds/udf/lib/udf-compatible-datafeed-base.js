@@ -19,7 +19,7 @@ export class UDFCompatibleDatafeedBase {
         this._requester = requester;
         this._historyProvider = new HistoryProvider(datafeedURL, this._requester, limitedServerResponse);
         this._quotesProvider = quotesProvider;
-        this._dataPulseProvider = new DataPulseProvider(this._historyProvider, updateFrequency);
+        this._dataPulseProvider = new DataPulseProvider(this._historyProvider, updateFrequency, datafeedURL);
         this._quotesPulseProvider = new QuotesPulseProvider(this._quotesProvider);
         this._configurationReadyPromise = this._requestConfiguration()
             .then((configuration) => {
@@ -263,7 +263,10 @@ export class UDFCompatibleDatafeedBase {
             throw new Error('Unsupported datafeed configuration. Must either support search, or support group request');
         }
         if (configurationData.supports_group_request || !configurationData.supports_search) {
-            this._symbolsStorage = new SymbolsStorage(this._datafeedURL, configurationData.supported_resolutions || [], this._requester);
+            const exchanges = configurationData.exchanges
+                .map((exchange) => exchange.value)
+                .filter((value) => value !== '');
+            this._symbolsStorage = new SymbolsStorage(this._datafeedURL, configurationData.supported_resolutions || [], this._requester, exchanges);
         }
         logMessage(`UdfCompatibleDatafeed: Initialized with ${JSON.stringify(configurationData)}`);
     }
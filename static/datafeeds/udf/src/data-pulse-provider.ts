@@ -1,4 +1,4 @@
-import { LibrarySymbolInfo, ResolutionString, SubscribeBarsCallback } from '../../../charting_library/datafeed-api';
+import { Bar, LibrarySymbolInfo, ResolutionString, SubscribeBarsCallback } from '../../../charting_library/datafeed-api';
 
 import {
 	getErrorMessage,
@@ -17,13 +17,24 @@ interface DataSubscribers {
 	[guid: string]: DataSubscriber;
 }
 
+interface StreamMessage {
+	symbol: string;
+	resolution: ResolutionString;
+	bars: Bar[];
+}
+
 export class DataPulseProvider implements IDataPulseProvider {
 	private readonly _subscribers: DataSubscribers = {};
 	private _requestsPending: number = 0;
 	private readonly _historyProvider: IHistoryProvider;
+	private _streamUrl: string | null;
+	private _stream: EventSource | null = null;
+	private _streamUpdateTimer: ReturnType<typeof setTimeout> | null = null;
 
-	public constructor(historyProvider: IHistoryProvider, updateFrequency: number) {
+	public constructor(historyProvider: IHistoryProvider, updateFrequency: number, streamUrl?: string) {
 		this._historyProvider = historyProvider;
+		// bars are pushed over a single SSE connection shared by all subscriptions when possible, polling is the fallback
+		this._streamUrl = streamUrl !== undefined && typeof EventSource !== 'undefined' ? streamUrl : null;
 		setInterval(this._updateData.bind(this), updateFrequency);
 	}
 
@@ -40,16 +51,18 @@ export class DataPulseProvider implements IDataPulseProvider {
 			symbolInfo: symbolInfo,
 		};
 
+		this._scheduleStreamUpdate();
 		logMessage(`DataPulseProvider: subscribed for #${listenerGuid} - {${symbolInfo.name}, ${resolution}}`);
 	}
 
 	public unsubscribeBars(listenerGuid: string): void {
 		delete this._subscribers[listenerGuid];
+		this._scheduleStreamUpdate();
 		logMessage(`DataPulseProvider: unsubscribed for #${listenerGuid}`);
 	}
 
 	private _updateData(): void {
-		if (this._requestsPending > 0) {
+		if (this._requestsPending > 0 || this._streamUrl !== null) {
 			return;
 		}
 
@@ -69,6 +82,78 @@ export class DataPulseProvider implements IDataPulseProvider {
 		}
 	}
 
+	private _scheduleStreamUpdate(): void {
+		// subscription changes made together (e.g. a layout with several charts) reopen the stream only once
+		if (this._streamUrl === null || this._streamUpdateTimer !== null) {
+			return;
+		}
+
+		this._streamUpdateTimer = setTimeout(() => {
+			this._streamUpdateTimer = null;
+			this._openStream();
+		}, 0);
+	}
+
+	private _openStream(): void {
+		if (this._stream !== null) {
+			this._stream.close();
+			this._stream = null;
+		}
+
+		const channels: { [key: string]: [string, string] } = {};
+		// eslint-disable-next-line guard-for-in
+		for (const listenerGuid in this._subscribers) {
+			const subscriptionRecord = this._subscribers[listenerGuid];
+			const ticker = subscriptionRecord.symbolInfo.ticker || '';
+			channels[`${ticker}|${subscriptionRecord.resolution}`] = [ticker, subscriptionRecord.resolution];
+		}
+
+		const keys = Object.keys(channels);
+		if (this._streamUrl === null || keys.length === 0) {
+			return;
+		}
+
+		// one connection for all subscriptions: browsers allow only a few connections per origin
+		const symbols = encodeURIComponent(keys.map((key: string) => channels[key][0]).join(','));
+		const resolutions = encodeURIComponent(keys.map((key: string) => channels[key][1]).join(','));
+		const stream = new EventSource(`${this._streamUrl}/stream?symbols=${symbols}&resolutions=${resolutions}`);
+
+		stream.onmessage = (event: MessageEvent) => {
+			this._onStreamDataReceived(JSON.parse(event.data));
+		};
+
+		stream.onerror = () => {
+			// CONNECTING means the browser reconnects by itself, CLOSED means the server refused the stream
+			if (stream.readyState === EventSource.CLOSED && this._stream === stream) {
+				logMessage('DataPulseProvider: stream closed, falling back to polling');
+				this._stream = null;
+				this._streamUrl = null;
+			}
+		};
+
+		this._stream = stream;
+	}
+
+	private _onStreamDataReceived(message: StreamMessage): void {
+		// the server sends only changed bars: the closed previous bar (when a new one starts) and the last one
+		// eslint-disable-next-line guard-for-in
+		for (const listenerGuid in this._subscribers) {
+			const subscriptionRecord = this._subscribers[listenerGuid];
+			if ((subscriptionRecord.symbolInfo.ticker || '') !== message.symbol || subscriptionRecord.resolution !== message.resolution) {
+				continue;
+			}
+
+			for (const bar of message.bars) {
+				if (subscriptionRecord.lastBarTime !== null && bar.time < subscriptionRecord.lastBarTime) {
+					continue;
+				}
+
+				subscriptionRecord.lastBarTime = bar.time;
+				subscriptionRecord.listener(bar);
+			}
+		}
+	}
+
 	private _updateDataForSubscriber(listenerGuid: string): Promise<void> {
 		const subscriptionRecord = this._subscribers[listenerGuid];
 
@@ -92,7 +92,7 @@ function symbolKey(symbol: string, currency?: string, unit?: string): string {
 }
 
 export class SymbolsStorage {
-	private readonly _exchangesList: string[] = ['NYSE', 'FOREX', 'AMEX'];
+	private readonly _exchangesList: string[];
 	private readonly _symbolsInfo: SymbolInfoMap = {};
 	private readonly _symbolsList: string[] = [];
 	private readonly _datafeedUrl: string;
@@ -100,7 +100,8 @@ export class SymbolsStorage {
 	private readonly _datafeedSupportedResolutions: ResolutionString[];
 	private readonly _requester: IRequester;
 
-	public constructor(datafeedUrl: string, datafeedSupportedResolutions: ResolutionString[], requester: IRequester) {
+	public constructor(datafeedUrl: string, datafeedSupportedResolutions: ResolutionString[], requester: IRequester, exchanges?: string[]) {
+		this._exchangesList = exchanges !== undefined && exchanges.length > 0 ? exchanges : ['NYSE', 'FOREX', 'AMEX'];
 		this._datafeedUrl = datafeedUrl;
 		this._datafeedSupportedResolutions = datafeedSupportedResolutions;
 		this._requester = requester;
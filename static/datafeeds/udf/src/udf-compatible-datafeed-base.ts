@@ -1,6 +1,7 @@
 import {
 	DatafeedConfiguration,
 	DatafeedErrorCallback,
+	Exchange,
 	GetMarksCallback,
 	HistoryCallback,
 	IDatafeedChartApi,
@@ -134,7 +135,7 @@ export class UDFCompatibleDatafeedBase implements IExternalDatafeed, IDatafeedQu
 		);
 		this._quotesProvider = quotesProvider;
 
-		this._dataPulseProvider = new DataPulseProvider(this._historyProvider, updateFrequency);
+		this._dataPulseProvider = new DataPulseProvider(this._historyProvider, updateFrequency, datafeedURL);
 		this._quotesPulseProvider = new QuotesPulseProvider(this._quotesProvider);
 
 		this._configurationReadyPromise = this._requestConfiguration()
@@ -412,7 +413,10 @@ export class UDFCompatibleDatafeedBase implements IExternalDatafeed, IDatafeedQu
 		}
 
 		if (configurationData.supports_group_request || !configurationData.supports_search) {
-			this._symbolsStorage = new SymbolsStorage(this._datafeedURL, configurationData.supported_resolutions || [], this._requester);
+			const exchanges = configurationData.exchanges
+				.map((exchange: Exchange) => exchange.value)
+				.filter((value: string) => value !== '');
+			this._symbolsStorage = new SymbolsStorage(this._datafeedURL, configurationData.supported_resolutions || [], this._requester, exchanges);
 		}
 
 		logMessage(`UdfCompatibleDatafeed: Initialized with ${JSON.stringify(configurationData)}`);